@@ -0,0 +1,106 @@
+"""Micro-benchmark of per-payload sensor value extraction.
+
+Compares the previous per-sensor approach (split the resource path and
+parse the field separately for every sensor) with the compiled
+ResourceExtractor. Only needs isodate; Home Assistant is not imported.
+
+    python benchmarks/extract_benchmark.py
+"""
+import importlib.util
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'polar')
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(f"polar_{name}", os.path.join(ROOT, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+const = load('const')
+extract = load('extract')
+
+PAYLOADS = {
+    const.CONF_TRAINING_DATA: {
+        'id': 1937529874,
+        'upload-time': '2008-10-13T10:40:02Z',
+        'polar-user': 'https://www.polaraccesslink/v3/users/1',
+        'transaction-id': 179879,
+        'device': 'Polar M400',
+        'start-time': '2008-10-13T10:40:02',
+        'duration': 'PT2H44M45.5S',
+        'calories': 530,
+        'distance': 1600.2,
+        'heart-rate': {'average': 129, 'maximum': 147},
+        'training-load': 143.22,
+        'sport': 'OTHER',
+        'has-route': True,
+        'club-id': 999,
+        'club-name': 'Polar Club',
+        'detailed-sport-info': 'RUNNING'},
+    const.CONF_DAILY_ACTIVITY: {
+        'id': 1234,
+        'polar-user': 'https://www.polaraccesslink/v3/users/1',
+        'transaction-id': 179879,
+        'date': '2010-12-31',
+        'created': '2016-04-27T20:11:33.000Z',
+        'calories': 2329,
+        'active-calories': 428,
+        'duration': 'PT2H44M',
+        'active-steps': 250},
+    const.CONF_PHYSICAL_INFO: {
+        'id': 123,
+        'transaction-id': 179879,
+        'created': '2016-04-27T20:11:33.000Z',
+        'polar-user': 'https://www.polaraccesslink/v3/users/1',
+        'weight': 80,
+        'height': 180,
+        'maximum-heart-rate': 160,
+        'resting-heart-rate': 60,
+        'aerobic-threshold': 123,
+        'anaerobic-threshold': 123,
+        'vo2-max': 12,
+        'weight-source': 'SOURCE_MEASURED'}}
+
+
+def per_sensor(resources, system, raw):
+    values = {}
+
+    for resource in resources:
+        item = raw
+
+        for key in resource.name.split('/'):
+            item = item[key]
+
+        values[resource.name] = resource.units.parse(item, system)
+
+    return values
+
+
+def main(number=20000, repeat=5):
+    system = const.SYSTEM_METRIC
+
+    for endpoint, raw in PAYLOADS.items():
+        resources = const.RESOURCES[endpoint]
+        extractor = extract.ResourceExtractor(resources, system)
+
+        assert per_sensor(resources, system, raw) == extractor.extract(raw)
+
+        # Best of several runs, so one noisy run does not decide the speedup.
+        before = min(timeit.repeat(lambda: per_sensor(resources, system, raw), number=number, repeat=repeat))
+        after = min(timeit.repeat(lambda: extractor.extract(raw), number=number, repeat=repeat))
+
+        print(
+            f"{endpoint:15} {len(resources):2d} resources  "
+            f"before {before / number * 1e6:7.2f} us/payload  "
+            f"after {after / number * 1e6:7.2f} us/payload  "
+            f"speedup {before / after:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
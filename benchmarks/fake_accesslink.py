@@ -0,0 +1,301 @@
+"""Local stand-in for the Polar AccessLink API.
+
+Serves synthetic transactions so the integration can be exercised without
+network access or real credentials. Item counts, payload sizes, response
+latency and error rates are configurable, JSON responses carry an ETag and
+honour If-None-Match, and GET /_stats reports how many requests were
+served. Only needs aiohttp.
+
+    python benchmarks/fake_accesslink.py --items 50 --latency 0.02
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import time
+
+from aiohttp import web
+
+API_PREFIX = '/v3'
+TOKEN_PATH = '/oauth2/token'
+STATS_PATH = '/_stats'
+
+RESULT_NAMES = {
+    'activity-transactions': 'activity-log',
+    'exercise-transactions': 'exercises',
+    'physical-information-transactions': 'physical-informations'}
+
+DATA_TYPES = {
+    'activity-transactions': 'ACTIVITY_SUMMARY',
+    'exercise-transactions': 'EXERCISE',
+    'physical-information-transactions': 'PHYSICAL_INFORMATION'}
+
+EPOCH = datetime.datetime(2020, 1, 1)
+
+
+def _timestamp(item_id):
+    return (EPOCH + datetime.timedelta(minutes=item_id)).isoformat()
+
+
+def _exercise(item_id):
+    return {
+        'id': item_id,
+        'upload-time': _timestamp(item_id + 90) + 'Z',
+        'device': 'Polar M430',
+        'start-time': _timestamp(item_id),
+        'duration': 'PT1H2M3.5S',
+        'calories': 400 + item_id % 300,
+        'distance': 8000.5 + item_id % 5000,
+        'heart-rate': {'average': 120 + item_id % 30, 'maximum': 160 + item_id % 30},
+        'training-load': 80.5 + item_id % 100,
+        'sport': 'RUNNING',
+        'has-route': False,
+        'club-id': 999,
+        'club-name': 'Polar Club',
+        'detailed-sport-info': 'RUNNING'}
+
+
+def _activity(item_id):
+    return {
+        'id': item_id,
+        'date': (EPOCH + datetime.timedelta(days=item_id)).date().isoformat(),
+        'created': _timestamp(item_id) + '.000Z',
+        'calories': 2000 + item_id % 800,
+        'active-calories': 300 + item_id % 400,
+        'duration': 'PT2H44M',
+        'active-steps': 5000 + item_id % 10000}
+
+
+def _physical_info(item_id):
+    return {
+        'id': item_id,
+        'created': _timestamp(item_id) + '.000Z',
+        'weight': 70 + item_id % 20,
+        'height': 180,
+        'maximum-heart-rate': 190,
+        'resting-heart-rate': 50 + item_id % 15,
+        'aerobic-threshold': 123,
+        'anaerobic-threshold': 160,
+        'vo2-max': 50,
+        'weight-source': 'SOURCE_MEASURED'}
+
+
+PAYLOADS = {
+    'activity-transactions': _activity,
+    'exercise-transactions': _exercise,
+    'physical-information-transactions': _physical_info}
+
+
+class FakeAccessLink:
+    """Synthetic AccessLink server state.
+
+    Every transaction lists `items` new item URLs; payloads are generated on
+    request from the item id, so the server's own memory stays flat.
+    """
+
+    def __init__(self, items=10, payload_bytes=0, latency=0.0, error_rate=0.0,
+                 rate_limit=100000, seed=0):
+        self.items = items
+        self.payload_bytes = payload_bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._transactions = {}
+        self._users = set()
+
+    def create_app(self):
+        app = web.Application(middlewares=[self._middleware])
+        transaction = API_PREFIX + '/users/{user_id}/{kind}/{transaction_id}'
+
+        app.router.add_get(STATS_PATH, self.stats)
+        app.router.add_post(TOKEN_PATH, self.token)
+        app.router.add_post(API_PREFIX + '/users', self.register_user)
+        app.router.add_get(API_PREFIX + '/notifications', self.notifications)
+        app.router.add_post(API_PREFIX + '/users/{user_id}/{kind}', self.create_transaction)
+        app.router.add_get(transaction, self.list_items)
+        app.router.add_put(transaction, self.commit)
+        app.router.add_get(transaction + '/{item_id}', self.get_item)
+
+        return app
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path == STATS_PATH:
+            return await handler(request)
+
+        self.requests += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text='Injected error')
+
+        response = await handler(request)
+
+        if request.method == 'GET' and response.status == 200 and response.body:
+            etag = f'"{hashlib.sha1(response.body).hexdigest()}"'
+
+            if request.headers.get('If-None-Match') == etag:
+                response = web.Response(status=304)
+
+            response.headers['ETag'] = etag
+
+        response.headers['RateLimit-Limit'] = f"{self.rate_limit}, {self.rate_limit * 10}"
+        response.headers['RateLimit-Usage'] = f"{self.requests}, {self.requests}"
+        response.headers['RateLimit-Reset'] = '900, 86400'
+
+        return response
+
+    async def stats(self, request):
+        return web.json_response({'requests': self.requests, 'errors': self.errors})
+
+    async def token(self, request):
+        user_id = next(self._ids)
+        self._users.add(str(user_id))
+
+        return web.json_response({
+            'access_token': f"token-{user_id}",
+            'token_type': 'bearer',
+            'x_user_id': user_id})
+
+    async def register_user(self, request):
+        body = await request.json()
+        self._users.add(str(body.get('member-id')))
+
+        return web.json_response({'polar-user-id': body.get('member-id')})
+
+    async def notifications(self, request):
+        if not self._users:
+            return web.Response(status=204)
+
+        base = f"{request.scheme}://{request.host}{API_PREFIX}"
+
+        return web.json_response({'available-user-data': [
+            {'user-id': int(user_id), 'data-type': data_type,
+             'url': f"{base}/users/{user_id}/{kind}"}
+            for user_id in sorted(self._users)
+            for kind, data_type in DATA_TYPES.items()]})
+
+    async def create_transaction(self, request):
+        kind = request.match_info['kind']
+
+        if kind not in RESULT_NAMES:
+            raise web.HTTPNotFound()
+
+        self._users.add(request.match_info['user_id'])
+
+        if not self.items:
+            return web.Response(status=204)
+
+        transaction_id = str(next(self._ids))
+        url = f"{request.scheme}://{request.host}{request.path}/{transaction_id}"
+        self._transactions[transaction_id] = [
+            f"{url}/{next(self._ids)}" for _ in range(self.items)]
+
+        return web.json_response(
+            {'transaction-id': int(transaction_id), 'resource-uri': url}, status=201)
+
+    def _transaction(self, request):
+        urls = self._transactions.get(request.match_info['transaction_id'])
+
+        if urls is None:
+            raise web.HTTPNotFound()
+
+        return urls
+
+    async def list_items(self, request):
+        urls = self._transaction(request)
+        return web.json_response({RESULT_NAMES[request.match_info['kind']]: urls})
+
+    async def commit(self, request):
+        self._transaction(request)
+        del self._transactions[request.match_info['transaction_id']]
+
+        return web.Response(status=200)
+
+    async def get_item(self, request):
+        self._transaction(request)
+        item_id = int(request.match_info['item_id'])
+        payload = PAYLOADS[request.match_info['kind']](item_id)
+        payload['transaction-id'] = int(request.match_info['transaction_id'])
+
+        padding = self.payload_bytes - len(json.dumps(payload)) - len(', "padding": ""')
+
+        if padding > 0:
+            payload['padding'] = 'x' * padding
+
+        return web.json_response(payload)
+
+
+def serve(port, options):
+    """Run a FakeAccessLink on 127.0.0.1:port until the process is killed."""
+    server = FakeAccessLink(**options)
+    web.run_app(server.create_app(), host='127.0.0.1', port=port, print=None)
+
+
+def start_server(**options):
+    """Start a FakeAccessLink in a separate process, returning (process, base URL)."""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    process = multiprocessing.get_context('spawn').Process(
+        target=serve, args=(port, options), daemon=True)
+    process.start()
+
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                break
+        except OSError:
+            if not process.is_alive():
+                raise RuntimeError('Fake AccessLink server failed to start')
+
+            time.sleep(0.05)
+    else:
+        process.terminate()
+        raise RuntimeError('Fake AccessLink server did not start in time')
+
+    return process, f"http://127.0.0.1:{port}"
+
+
+def add_arguments(parser):
+    parser.add_argument('--items', type=int, default=10, help='items per transaction')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='minimum item payload size')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--rate-limit', type=int, default=100000, help='advertised short-term request limit')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def server_options(args):
+    return {
+        'items': args.items,
+        'payload_bytes': args.payload_bytes,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'rate_limit': args.rate_limit,
+        'seed': args.seed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"Serving fake AccessLink on http://127.0.0.1:{args.port}{API_PREFIX}")
+    serve(args.port, server_options(args))
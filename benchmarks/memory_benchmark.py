@@ -0,0 +1,208 @@
+"""Memory used by Polar's model objects and by each configured account.
+
+The first part walks the resource, unit and endpoint definitions in
+const.py and reports how many distinct objects they are made of and the
+bytes those objects hold, without Home Assistant. The second part, which
+needs no Home Assistant either, builds the model objects and extractors of
+--accounts accounts twice: once per entry, as before they were shared, with
+every account holding its own unit and resource copies and extractors, and
+once with the shared objects. It reports the memory added per account by
+each. The last part, which needs Home Assistant installed and is skipped
+otherwise, builds the coordinators with every resource monitored, feeds
+each sensor group one payload and reports the Python memory added per
+account.
+
+    python benchmarks/memory_benchmark.py --accounts 50
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'polar')
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(f"polar_{name}", os.path.join(ROOT, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def model_objects(const):
+    """Return every distinct resource, unit and endpoint object, by id."""
+    resources = [
+        resource
+        for group in (const.RESOURCES, const.STATISTICS)
+        for resources in group.values()
+        for resource in resources]
+    resources += const.SAMPLE_RESOURCES + const.ACTIVITY_SAMPLE_RESOURCES + const.DIAGNOSTICS
+
+    objects = {id(resource): resource for resource in resources}
+    objects.update((id(resource.units), resource.units) for resource in resources)
+    objects.update((id(endpoint), endpoint) for endpoint in const.ENDPOINTS.values())
+
+    return objects, resources
+
+
+def owned_size(value, seen):
+    """Size of an object and the containers it owns; shared atoms are free."""
+    if id(value) in seen or isinstance(value, (str, int, float, bool, type(None))):
+        return 0
+
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(owned_size(item, seen) for item in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(owned_size(item, seen) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += owned_size(vars(value), seen)
+
+    for name in getattr(type(value), '__slots__', ()):
+        if hasattr(value, name):
+            size += owned_size(getattr(value, name), seen)
+
+    return size
+
+
+def report_models():
+    const = load('const')
+    objects, resources = model_objects(const)
+    units = {id(resource.units) for resource in resources}
+    seen = set()
+    size = sum(owned_size(item, seen) for item in objects.values())
+
+    print(
+        f"Model objects: {len(resources)} resources sharing {len(units)} unit objects, "
+        f"{len(const.ENDPOINTS)} endpoints, {size} bytes")
+
+
+def copy_unit(unit):
+    """A private copy of an interned unit, as each entry built before sharing."""
+    copy = object.__new__(type(unit))
+
+    for cls in type(unit).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(unit, name):
+                object.__setattr__(copy, name, getattr(unit, name))
+
+    return copy
+
+
+def build_per_entry(const, extract, system):
+    """One account's resources and extractors with nothing shared between entries."""
+    built = []
+
+    for resources in const.RESOURCES.values():
+        copies = [
+            const.PolarResource(resource.name, resource.friendly_name, copy_unit(resource.units), resource.icon)
+            for resource in resources]
+        built.append((copies, extract.ResourceExtractor(copies, system)))
+
+    return built
+
+
+def build_shared(const, extract, system):
+    """One account's resources and extractors as entries build them now."""
+    built = []
+
+    for resources in const.RESOURCES.values():
+        resources = list(resources)
+        built.append((resources, extract.shared_extractor(tuple(resources), system)))
+
+    return built
+
+
+def measure_builds(accounts):
+    const = load('const')
+    extract = load('extract')
+    system = const.SYSTEM_METRIC
+    results = {}
+
+    for title, build in (('per entry', build_per_entry), ('shared', build_shared)):
+        kept = []
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+
+        for _ in range(accounts):
+            kept.append(build(const, extract, system))
+
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[title] = (after - before) / accounts
+
+    print(
+        f"Model objects for {accounts} accounts: per entry {results['per entry'] / 1024:.1f} KiB, "
+        f"shared {results['shared'] / 1024:.1f} KiB per account "
+        f"({results['per entry'] / results['shared']:.1f}x smaller)")
+
+
+async def measure_accounts(accounts):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+    from custom_components.polar.client import AccessLinkClient
+    from custom_components.polar.const import ENDPOINTS, RESOURCE_NAMES, SYSTEM_METRIC
+    from custom_components.polar.coordinator import PolarCoordinator
+    from custom_components.polar.sensor import add_resource_entities
+    from custom_components.polar.store import PolarRecordStore
+
+    import fake_accesslink
+    from update_benchmark import create_hass
+
+    payloads = {
+        name: fake_accesslink.PAYLOADS[endpoint.transaction_path](1)
+        for name, endpoint in ENDPOINTS.items()}
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = create_hass(config_dir)
+        accesslink = AccessLinkClient(None, 'benchmark-client', 'benchmark-secret')
+        kept = []
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+
+        for user_id in range(accounts):
+            store = PolarRecordStore(hass, hass.config.path('polar', str(user_id)))
+            coordinator = PolarCoordinator(hass, accesslink, store, user_id, 'token', ENDPOINTS)
+            entities = []
+
+            for name in ENDPOINTS:
+                group = []
+                add_resource_entities(group, coordinator, name, RESOURCE_NAMES[name], SYSTEM_METRIC)
+                group[0].async_write_changes(payloads[name])
+                entities += group
+
+            kept.append((coordinator, entities))
+
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        await hass.async_stop(force=True)
+
+    per_account = (after - before) / accounts
+    sensors = len(kept[0][1])
+    print(
+        f"Accounts: {accounts} with {sensors} sensors each, "
+        f"{per_account / 1024:.1f} KiB per account, {per_account / sensors:.0f} bytes per sensor")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=50, help='accounts to build, 0 to skip')
+    args = parser.parse_args()
+
+    report_models()
+
+    if args.accounts:
+        measure_builds(args.accounts)
+
+        if importlib.util.find_spec('homeassistant') is None:
+            print('Home Assistant is not installed, skipping the coordinator measurement')
+        else:
+            asyncio.run(measure_accounts(args.accounts))
@@ -0,0 +1,137 @@
+"""Micro-benchmark of ISO 8601 duration and timestamp parsing.
+
+Builds a corpus shaped like AccessLink payloads: exercise and activity
+durations, activity zone sample durations (which repeat a lot) and local,
+UTC and offset timestamps. Every value is first checked against isodate,
+then parse time is compared with isodate with a cold memo cache, and with
+a warm one over values that fit in it. Only needs isodate; Home Assistant
+is not imported.
+
+    python benchmarks/parse_benchmark.py --values 100000
+"""
+import argparse
+import datetime
+import importlib.util
+import os
+import random
+import sys
+import time
+
+import isodate
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'polar')
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(f"polar_{name}", os.path.join(ROOT, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+const = load('const')
+
+START = datetime.datetime(2018, 1, 1)
+
+
+def format_duration(seconds, fraction=False):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    text = 'PT'
+
+    if hours:
+        text += f"{hours}H"
+
+    if minutes:
+        text += f"{minutes}M"
+
+    if seconds or fraction or text == 'PT':
+        text += f"{seconds}.{random.randint(0, 9)}S" if fraction else f"{seconds}S"
+
+    return text
+
+
+def duration_corpus(count):
+    values = []
+
+    for _ in range(count):
+        kind = random.random()
+
+        if kind < 0.6:
+            # Zone samples: whole minutes, mostly short.
+            values.append(format_duration(60 * random.randint(0, 60)))
+        elif kind < 0.8:
+            values.append(format_duration(random.randint(600, 3 * 3600), fraction=True))
+        else:
+            values.append(format_duration(random.randint(3600, 16 * 3600)))
+
+    return values
+
+
+def timestamp_corpus(count):
+    values = []
+
+    for _ in range(count):
+        moment = START + datetime.timedelta(seconds=random.randint(0, 3 * 365 * 86400))
+        kind = random.random()
+
+        if kind < 0.5:
+            values.append(moment.isoformat())
+        elif kind < 0.8:
+            values.append(moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{random.randint(0, 999):03}Z")
+        else:
+            values.append(moment.isoformat() + random.choice(('+02:00', '-05:00', '+0530')))
+
+    return values
+
+
+def check(values, fast, reference):
+    for value in values:
+        expected = reference(value)
+        actual = fast(value)
+
+        aware = getattr(expected, 'tzinfo', None) is not None
+
+        if actual != expected or (getattr(actual, 'tzinfo', None) is not None) != aware:
+            raise AssertionError(f"{value}: {actual!r} != {expected!r}")
+
+
+def timed(parse, values, clear=None):
+    if clear is not None:
+        clear()
+
+    started = time.perf_counter()
+
+    for value in values:
+        parse(value)
+
+    return (time.perf_counter() - started) / len(values)
+
+
+def report(title, values, fast, reference):
+    check(values, fast, reference)
+
+    before = min(timed(reference, values) for _ in range(3))
+    cold = min(timed(fast, values, fast.cache_clear) for _ in range(3))
+    distinct = len(set(values))
+    # Values repeated within the memo size, as when a payload is parsed again.
+    recent = values[:const.PARSE_CACHE_SIZE]
+    timed(fast, recent, fast.cache_clear)
+    warm = min(timed(fast, recent) for _ in range(3))
+
+    print(
+        f"{title:11} {len(values)} values, {distinct} distinct  "
+        f"isodate {before * 1e6:6.2f} us  cold {cold * 1e6:6.2f} us ({before / cold:4.1f}x)  "
+        f"warm {warm * 1e6:6.2f} us ({before / warm:4.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--values', type=int, default=100000, help='values per corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report('durations', duration_corpus(args.values), const.parse_duration, isodate.parse_duration)
+    report('timestamps', timestamp_corpus(args.values), const.parse_timestamp, isodate.parse_datetime)
@@ -0,0 +1,95 @@
+"""Simulation of fixed versus adaptive polling for a synthetic sync pattern.
+
+A simulated user syncs every morning around 07:00 and after an evening
+workout around 18:30 on four days a week. Each strategy polls for the
+simulated period; reported are API polls per day and the mean and 95th
+percentile delay between a sync and the poll that picks it up. Nothing
+outside the standard library is needed.
+
+    python benchmarks/polling_benchmark.py --days 60
+"""
+import argparse
+import datetime
+import importlib.util
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'polar')
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(f"polar_{name}", os.path.join(ROOT, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+polling = load('polling')
+
+START = datetime.datetime(2020, 1, 6)
+
+
+def sync_times(days, rng):
+    times = []
+
+    for day in range(days):
+        midnight = START + datetime.timedelta(days=day)
+        times.append(midnight + datetime.timedelta(hours=rng.gauss(7, 0.35)))
+
+        if day % 7 in (0, 1, 3, 5):
+            times.append(midnight + datetime.timedelta(hours=rng.gauss(18.5, 0.75)))
+
+    return sorted(times)
+
+
+def simulate(times, days, next_delay, observe=None):
+    end = START + datetime.timedelta(days=days)
+    now = START
+    pending = 0
+    polls = 0
+    delays = []
+
+    while now < end:
+        polls += 1
+
+        while pending < len(times) and times[pending] <= now:
+            delays.append((now - times[pending]).total_seconds() / 60)
+
+            if observe is not None:
+                observe(times[pending], now)
+
+            pending += 1
+
+        now += datetime.timedelta(seconds=next_delay(now))
+
+    delays.sort()
+    return polls / days, sum(delays) / len(delays), delays[int(0.95 * len(delays))]
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    times = sync_times(args.days, rng)
+    base = args.base * 60
+
+    results = {
+        f"fixed {args.base} min": simulate(times, args.days, lambda now: base)}
+
+    schedule = polling.SyncSchedule(base, args.min * 60, args.max * 60)
+    results[f"adaptive {args.min}-{args.max} min"] = simulate(
+        times, args.days, schedule.next_delay,
+        lambda moment, now: schedule.observe(moment, now.date().toordinal()))
+
+    for name, (polls, mean, p95) in results.items():
+        print(f"{name:24} {polls:5.1f} polls/day  mean delay {mean:5.1f} min  p95 {p95:5.1f} min")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--base', type=int, default=30, help='fixed interval in minutes')
+    parser.add_argument('--min', type=int, default=10, help='adaptive minimum interval in minutes')
+    parser.add_argument('--max', type=int, default=240, help='adaptive maximum interval in minutes')
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
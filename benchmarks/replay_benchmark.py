@@ -0,0 +1,142 @@
+"""Replay a recorded AccessLink cassette through the Polar update pipeline.
+
+Every transaction in the cassette starts a coordinator refresh of its
+endpoint at its recorded time, divided by --speed, and the responses are
+served from the cassette with their durations scaled the same way. A week
+of traffic recorded with `cassette_mode: record` can then be profiled offline
+at 100x. Needs Home Assistant installed.
+
+    python benchmarks/replay_benchmark.py polar_cassette.jsonl.gz --speed 100 --profile replay.prof
+"""
+import argparse
+import asyncio
+import cProfile
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from custom_components.polar.cassette import ReplaySession, read_cassette
+from custom_components.polar.client import AccessLinkClient
+from custom_components.polar.const import ENDPOINTS, RESOURCE_NAMES, SYSTEM_METRIC
+from custom_components.polar.coordinator import PolarCoordinator
+from custom_components.polar.sensor import add_resource_entities
+from custom_components.polar.store import PolarRecordStore
+
+from update_benchmark import LoopMonitor, create_hass, percentile
+
+TRANSACTION_URL = re.compile(r'/users/(\d+)/([a-z-]+-transactions)$')
+
+ENDPOINTS_BY_PATH = {endpoint.transaction_path: name for name, endpoint in ENDPOINTS.items()}
+
+
+def transaction_starts(entries):
+    """Return (time, user id, endpoint name) for each recorded transaction."""
+    starts = []
+
+    for entry in entries:
+        match = TRANSACTION_URL.search(entry['u']) if entry['m'] == 'POST' else None
+
+        if match and match.group(2) in ENDPOINTS_BY_PATH:
+            starts.append((entry['t'], match.group(1), ENDPOINTS_BY_PATH[match.group(2)]))
+
+    return sorted(starts)
+
+
+async def replay(args):
+    entries = read_cassette(args.cassette)
+    starts = transaction_starts(entries)
+    users = sorted({user_id for _, user_id, _ in starts})
+
+    if not starts:
+        print('No transactions found in cassette')
+        return
+
+    session = ReplaySession(entries, args.speed)
+    accesslink = AccessLinkClient(session, 'replay-client', 'replay-secret')
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = create_hass(config_dir)
+        coordinators = {}
+
+        for user_id in users:
+            store = PolarRecordStore(hass, hass.config.path('polar', user_id))
+            await store.async_load()
+            coordinator = PolarCoordinator(hass, accesslink, store, user_id, 'replay-token', ENDPOINTS)
+
+            for name in ENDPOINTS:
+                entities = []
+                add_resource_entities(entities, coordinator, name, RESOURCE_NAMES[name], SYSTEM_METRIC)
+
+                for index, entity in enumerate(entities):
+                    entity.hass = hass
+                    entity.entity_id = f"sensor.polar_{user_id}_{name}_{index}"
+
+                coordinator.async_add_listener(name, entities[0].async_update_from_item)
+
+            coordinators[user_id] = coordinator
+
+        latencies = []
+        monitor = LoopMonitor()
+        profiler = cProfile.Profile() if args.profile else None
+        tracemalloc.start()
+        monitor.start()
+
+        if profiler is not None:
+            profiler.enable()
+
+        started = time.perf_counter()
+        origin = starts[0][0]
+
+        for offset, user_id, name in starts:
+            if args.speed:
+                await asyncio.sleep(max(0, (offset - origin) / args.speed - (time.perf_counter() - started)))
+
+            refresh_started = time.perf_counter()
+            await coordinators[user_id].async_refresh([name])
+            latencies.append(time.perf_counter() - refresh_started)
+
+        elapsed = time.perf_counter() - started
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+        monitor.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        await hass.async_stop(force=True)
+
+    print(
+        f"Replayed {len(starts)} transactions for {len(users)} users, "
+        f"{(starts[-1][0] - origin) / 3600:.1f} h of traffic in {elapsed:.1f} s")
+    print(
+        f"  refresh p50 {percentile(latencies, 0.5) * 1000:.1f} ms  "
+        f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms  "
+        f"max {max(latencies) * 1000:.1f} ms")
+    print(
+        f"  {session.served} responses served, {session.missed} missing from cassette")
+    print(
+        f"  loop blocked {monitor.blocked * 1000:.1f} ms in {monitor.stalls} stalls "
+        f"(longest {monitor.longest * 1000:.1f} ms), peak memory {peak / 1024:.0f} KiB")
+
+    if args.profile:
+        print(f"  profile written to {args.profile}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cassette', help='cassette recorded with cassette_mode: record')
+    parser.add_argument('--speed', type=float, default=100, help='time compression, 0 for none')
+    parser.add_argument('--profile', help='write cProfile stats of the replay to this file')
+    parser.add_argument('--verbose', action='store_true', help='show integration logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    asyncio.run(replay(args))
@@ -0,0 +1,320 @@
+"""End-to-end benchmark of Polar updates against a local fake AccessLink.
+
+Starts benchmarks/fake_accesslink.py in a separate process and drives the
+real PolarCoordinator, PolarEndpoint and PolarMasterSensor update path, and
+the PolarAuthCallbackView OAuth callback, through it. Reports update
+latency, requests per update, event-loop blocking and peak Python memory.
+Needs Home Assistant installed.
+
+    python benchmarks/update_benchmark.py --items 50 --payload-bytes 4096 --latency 0.02
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from homeassistant import data_entry_flow
+from homeassistant.core import HomeAssistant
+
+from custom_components.polar.cache import ResponseCache
+from custom_components.polar.client import AccessLinkClient
+from custom_components.polar.config_flow import PolarConfigFlow, PolarAuthCallbackView
+from custom_components.polar.const import (
+    DOMAIN, ENDPOINTS, RESOURCE_NAMES, SYSTEM_METRIC, CONF_CLIENT_ID,
+    CONF_CLIENT_SECRET)
+from custom_components.polar.coordinator import PolarCoordinator
+from custom_components.polar.scheduler import RequestScheduler
+from custom_components.polar.sensor import add_resource_entities
+from custom_components.polar.store import PolarRecordStore
+
+import fake_accesslink
+
+USER_ID = 1000000
+CLIENT_ID = 'benchmark-client'
+CLIENT_SECRET = 'benchmark-secret'
+
+
+class LoopMonitor:
+    """Measures event loop blocking from the lag of a short repeating sleep."""
+
+    def __init__(self, interval=0.001, threshold=0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.longest = 0.0
+        self.stalls = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.longest = max(self.longest, lag)
+
+            if lag >= self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+
+
+class CallbackFlowManager:
+    """Routes OAuth callbacks to config flows, in place of the HA flow manager."""
+
+    def __init__(self):
+        self.flows = {}
+
+    async def async_configure(self, flow_id, user_input=None):
+        flow = self.flows.pop(flow_id, None)
+
+        if flow is None:
+            raise data_entry_flow.UnknownFlow
+
+        await flow.async_step_oauth(user_input)
+        return await flow.async_step_finish()
+
+    # Read by ConfigFlow.async_set_unique_id; no other flow is ever in progress.
+    def async_progress(self, include_uninitialized=False):
+        return []
+
+    def async_progress_by_handler(self, handler, include_uninitialized=False, match_context=None):
+        return []
+
+
+class CallbackConfigEntries:
+    """The parts of the config entry manager a config flow reads, with no entries."""
+
+    def __init__(self, flow):
+        self.flow = flow
+
+    def async_entries(self, domain=None, *args, **kwargs):
+        return []
+
+    def async_entry_for_domain_unique_id(self, domain, unique_id):
+        return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def create_hass(config_dir):
+    if 'config_dir' in inspect.signature(HomeAssistant).parameters:
+        return HomeAssistant(config_dir)
+
+    hass = HomeAssistant()
+    hass.config.config_dir = config_dir
+    return hass
+
+
+def create_client(session, server_url, scheduler=None, cache=None):
+    return AccessLinkClient(
+        session, CLIENT_ID, CLIENT_SECRET,
+        scheduler=scheduler,
+        cache=cache,
+        base_url=f"{server_url}{fake_accesslink.API_PREFIX}",
+        token_url=f"{server_url}{fake_accesslink.TOKEN_PATH}")
+
+
+async def server_requests(session, server_url):
+    async with session.get(f"{server_url}{fake_accesslink.STATS_PATH}") as response:
+        return (await response.json())['requests']
+
+
+async def run_updates(hass, session, server_url, args):
+    """Pull every endpoint args.updates times through coordinator and sensors."""
+    store = PolarRecordStore(hass, hass.config.path('polar', str(USER_ID)))
+    await store.async_load()
+
+    accesslink = create_client(
+        session, server_url, RequestScheduler(args.rate_limit), ResponseCache())
+    coordinator = PolarCoordinator(
+        hass, accesslink, store, USER_ID, 'benchmark-token', args.endpoints, args.concurrency)
+
+    for name in args.endpoints:
+        entities = []
+        add_resource_entities(entities, coordinator, name, RESOURCE_NAMES[name], SYSTEM_METRIC)
+
+        for index, entity in enumerate(entities):
+            entity.hass = hass
+            entity.entity_id = f"sensor.polar_{name}_{index}"
+
+        # The master sensor is added first; this is what async_added_to_hass subscribes.
+        coordinator.async_add_listener(name, entities[0].async_update_from_item)
+
+    results = {name: {'latency': [], 'requests': [], 'failed': 0} for name in args.endpoints}
+
+    for _ in range(args.updates):
+        for name in args.endpoints:
+            previous = coordinator.last_refresh[name]
+            before = await server_requests(session, server_url)
+            started = time.perf_counter()
+
+            await coordinator.async_refresh([name])
+
+            elapsed = time.perf_counter() - started
+            requests = await server_requests(session, server_url) - before
+
+            results[name]['latency'].append(elapsed)
+            results[name]['requests'].append(requests)
+
+            if coordinator.last_refresh[name] is previous:
+                results[name]['failed'] += 1
+
+    print(f"Response cache: {accesslink.cache.stats}")
+
+    return results
+
+
+async def run_callbacks(hass, session, server_url, args):
+    """Complete args.callbacks OAuth callbacks through PolarAuthCallbackView."""
+    flows = CallbackFlowManager()
+    hass.config_entries = CallbackConfigEntries(flows)
+    hass.http = types.SimpleNamespace(register_view=lambda view: None)
+
+    app = web.Application()
+    app['hass'] = hass
+    view = PolarAuthCallbackView()
+    app.router.add_get(view.url, view.get)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    callback_url = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    await web.SockSite(runner, listener).start()
+    hass.config.api = types.SimpleNamespace(base_url=callback_url)
+
+    results = {'latency': [], 'requests': [], 'failed': 0}
+
+    try:
+        for index in range(args.callbacks):
+            flow = PolarConfigFlow()
+            flow.hass = hass
+            flow.handler = DOMAIN
+            flow.flow_id = f"benchmark-{index}"
+            flow.context = {'source': 'user'}
+            flow.data = {CONF_CLIENT_ID: CLIENT_ID, CONF_CLIENT_SECRET: CLIENT_SECRET}
+            flow.accesslink_client = create_client(session, server_url)
+            flows.flows[flow.flow_id] = flow
+
+            before = await server_requests(session, server_url)
+            started = time.perf_counter()
+
+            async with session.get(
+                    f"{callback_url}{view.url}",
+                    params={'state': flow.flow_id, 'code': 'benchmark-code'}) as response:
+                await response.read()
+                status = response.status
+
+            results['latency'].append(time.perf_counter() - started)
+            results['requests'].append(await server_requests(session, server_url) - before)
+
+            if status != 200:
+                results['failed'] += 1
+    finally:
+        await runner.cleanup()
+
+    return results
+
+
+async def measure(coroutine):
+    """Run a benchmark phase, returning (result, loop monitor, peak memory)."""
+    monitor = LoopMonitor()
+    tracemalloc.start()
+    monitor.start()
+
+    try:
+        result = await coroutine
+    finally:
+        monitor.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return result, monitor, peak
+
+
+def report(title, results, monitor, peak):
+    print(title)
+
+    for name, result in results.items():
+        latency = result['latency']
+        requests = result['requests']
+
+        print(
+            f"  {name:15} p50 {percentile(latency, 0.5) * 1000:8.1f} ms  "
+            f"p95 {percentile(latency, 0.95) * 1000:8.1f} ms  "
+            f"max {max(latency, default=0) * 1000:8.1f} ms  "
+            f"{sum(requests) / max(1, len(requests)):6.1f} requests/run  "
+            f"{result['failed']} failed")
+
+    print(
+        f"  loop blocked {monitor.blocked * 1000:.1f} ms in {monitor.stalls} stalls "
+        f"(longest {monitor.longest * 1000:.1f} ms), peak memory {peak / 1024:.0f} KiB")
+
+
+async def main(args):
+    process, server_url = fake_accesslink.start_server(**fake_accesslink.server_options(args))
+
+    try:
+        with tempfile.TemporaryDirectory() as config_dir:
+            hass = create_hass(config_dir)
+
+            async with aiohttp.ClientSession() as session:
+                results, monitor, peak = await measure(
+                    run_updates(hass, session, server_url, args))
+                report(
+                    f"Updates: {args.updates} per endpoint, {args.items} items each, "
+                    f"concurrency {args.concurrency}", results, monitor, peak)
+
+                if args.callbacks:
+                    results, monitor, peak = await measure(
+                        run_callbacks(hass, session, server_url, args))
+                    report(
+                        f"OAuth callbacks: {args.callbacks}",
+                        {'auth_callback': results}, monitor, peak)
+
+            await hass.async_stop(force=True)
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    fake_accesslink.add_arguments(parser)
+    parser.add_argument('--updates', type=int, default=10, help='update runs per endpoint')
+    parser.add_argument('--callbacks', type=int, default=10, help='OAuth callbacks to complete')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel item fetches')
+    parser.add_argument(
+        '--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--verbose', action='store_true', help='show integration logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    if not args.verbose:
+        # Injected errors are logged with tracebacks by the coordinator.
+        logging.getLogger('custom_components.polar').setLevel(logging.CRITICAL)
+
+    asyncio.run(main(args))
@@ -1,18 +1,40 @@
 """The Polar component."""
 __version__ = '0.0.2'
 
+import datetime
 import logging
+import time
+import zlib
 
 import voluptuous as vol
 
 from homeassistant import config_entries
 from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
+from homeassistant.const import EVENT_CORE_CONFIG_UPDATE
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
 
+from .cache import ResponseCache
+from .client import AccessLinkClient
 from .const import (
     DOMAIN, CONF_CLIENT_ID, CONF_CLIENT_SECRET, CONF_UNIT_SYSTEM,
+    CONF_USER_ID, CONF_ACCESS_TOKEN,
     CONF_MONITORED_RESOURCES, CONF_DAILY_ACTIVITY, CONF_TRAINING_DATA,
-    CONF_PHYSICAL_INFO, RESOURCE_NAMES)
+    CONF_PHYSICAL_INFO, CONF_FETCH_CONCURRENCY, DEFAULT_FETCH_CONCURRENCY,
+    CONF_WEBHOOK, CONF_STATISTICS, CONF_EXERCISE_SAMPLES, CONF_ACTIVITY_SAMPLES,
+    CONF_DIAGNOSTICS,
+    CONF_ADAPTIVE_POLLING, CONF_MIN_SCAN_INTERVAL, CONF_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL, CONF_CASSETTE_MODE,
+    CONF_CASSETTE_PATH, CONF_REPLAY_SPEED, DEFAULT_CASSETTE_PATH,
+    DEFAULT_REPLAY_SPEED, CASSETTE_MODE_RECORD, CASSETTE_MODE_REPLAY,
+    DATA_COORDINATORS, DATA_CLIENTS, STORE_DIRECTORY, SAMPLES_DIRECTORY,
+    ACTIVITY_SAMPLES_DIRECTORY, RESOURCE_NAMES)
+from .coordinator import (
+    PolarCoordinator, SCAN_INTERVAL, WEBHOOK_SCAN_INTERVAL, STAGGER_WINDOW)
+from .helpers import entry_options, client_session, async_setup_cassette
+from .scheduler import RequestScheduler
+from .services import async_register_services
+from .store import PolarRecordStore
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,6 +44,22 @@ CONFIG_SCHEMA = vol.Schema(
             CONF_CLIENT_ID: cv.string,
             CONF_CLIENT_SECRET: cv.string,
             CONF_UNIT_SYSTEM: cv.unit_system,
+            vol.Optional(CONF_FETCH_CONCURRENCY, default=DEFAULT_FETCH_CONCURRENCY):
+                vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_WEBHOOK, default=False): cv.boolean,
+            vol.Optional(CONF_STATISTICS, default=False): cv.boolean,
+            vol.Optional(CONF_EXERCISE_SAMPLES, default=False): cv.boolean,
+            vol.Optional(CONF_ACTIVITY_SAMPLES, default=False): cv.boolean,
+            vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+            vol.Optional(CONF_ADAPTIVE_POLLING, default=False): cv.boolean,
+            vol.Optional(CONF_MIN_SCAN_INTERVAL, default=DEFAULT_MIN_SCAN_INTERVAL):
+                vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_MAX_SCAN_INTERVAL, default=DEFAULT_MAX_SCAN_INTERVAL):
+                vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_CASSETTE_MODE): vol.In([CASSETTE_MODE_RECORD, CASSETTE_MODE_REPLAY]),
+            vol.Optional(CONF_CASSETTE_PATH, default=DEFAULT_CASSETTE_PATH): cv.string,
+            vol.Optional(CONF_REPLAY_SPEED, default=DEFAULT_REPLAY_SPEED):
+                vol.All(vol.Coerce(float), vol.Range(min=0)),
             CONF_MONITORED_RESOURCES: {
                 CONF_DAILY_ACTIVITY: vol.All(
                     cv.ensure_list,
@@ -44,6 +82,11 @@ async def async_setup(hass, config):
 
     hass.data[DOMAIN] = conf or {}
 
+    async_register_services(hass)
+
+    if conf is not None:
+        await async_setup_cassette(hass, conf)
+
     if conf is not None:
         _LOGGER.debug('Setting up Polar config flow from configuration data')
 
@@ -59,18 +102,125 @@ async def async_setup(hass, config):
 async def async_setup_entry(hass, entry):
     """Set up Polar integration from a config entry."""
     _LOGGER.debug('Setting up Polar integration')
+    started = time.monotonic()
+
+    config = entry_options(hass, entry)
+    resources_by_endpoint = config[CONF_MONITORED_RESOURCES]
+
+    # One client, connection pool and rate-limit bucket per client_id.
+    client_id = entry.data.get(CONF_CLIENT_ID)
+    clients = hass.data.setdefault(DATA_CLIENTS, {})
+
+    if client_id not in clients:
+        clients[client_id] = AccessLinkClient(
+            client_session(hass),
+            client_id=client_id,
+            client_secret=entry.data.get(CONF_CLIENT_SECRET),
+            scheduler=RequestScheduler(),
+            cache=ResponseCache())
+
+    accesslink = clients[client_id]
+
+    if config.get(CONF_WEBHOOK):
+        from .webhook import async_setup_webhook
+
+        # Registering with AccessLink needs the network, so it is not awaited.
+        hass.async_create_task(async_setup_webhook(hass, entry, accesslink))
+        scan_interval = WEBHOOK_SCAN_INTERVAL
+    else:
+        scan_interval = SCAN_INTERVAL
+
+    user_id = entry.data.get(CONF_USER_ID)
+
+    if entry.unique_id is None:
+        # Entries created before accounts had unique IDs.
+        hass.config_entries.async_update_entry(entry, unique_id=str(user_id))
+
+    # Indexing stored records reads the whole file, so it runs in the
+    # background; entities start from their restored state meanwhile.
+    store = PolarRecordStore(hass, hass.config.path(STORE_DIRECTORY, str(user_id)))
+    hass.async_create_task(store.async_load())
+
+    coordinator = PolarCoordinator(
+        hass,
+        accesslink,
+        store,
+        user_id,
+        entry.data.get(CONF_ACCESS_TOKEN),
+        resources_by_endpoint.keys(),
+        config.get(CONF_FETCH_CONCURRENCY, DEFAULT_FETCH_CONCURRENCY),
+        scan_interval,
+        zlib.crc32(entry.entry_id.encode()) % STAGGER_WINDOW)
+    coordinator.options = dict(entry.options)
+
+    if config.get(CONF_ADAPTIVE_POLLING) and not config.get(CONF_WEBHOOK):
+        await coordinator.async_enable_adaptive_polling(
+            datetime.timedelta(minutes=config.get(CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL)),
+            datetime.timedelta(minutes=config.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL)))
+
+    # Optional features import their modules only when enabled.
+    if config.get(CONF_STATISTICS):
+        from .stats import PolarStatistics
+
+        coordinator.statistics = PolarStatistics(hass, user_id)
+        await coordinator.statistics.async_load()
+
+    if config.get(CONF_EXERCISE_SAMPLES):
+        from .samples import ExerciseSampleStore
+
+        coordinator.samples = ExerciseSampleStore(
+            hass, hass.config.path(STORE_DIRECTORY, str(user_id), SAMPLES_DIRECTORY))
+        await coordinator.samples.async_load()
+
+    if config.get(CONF_ACTIVITY_SAMPLES):
+        from .timeseries import ActivitySampleStore
+
+        coordinator.activity_samples = ActivitySampleStore(
+            hass, hass.config.path(STORE_DIRECTORY, str(user_id), ACTIVITY_SAMPLES_DIRECTORY))
+        await coordinator.activity_samples.async_load()
+
+    hass.data.setdefault(DATA_COORDINATORS, {})[entry.entry_id] = coordinator
+    coordinator.async_start()
+
+    coordinator.async_on_stop(entry.add_update_listener(async_update_options))
+
+    @callback
+    def async_core_config_updated(event):
+        # Entries without their own unit system follow Home Assistant's; sensor
+        # values are rebuilt from stored records, so nothing is fetched again.
+        if entry_options(hass, entry)[CONF_UNIT_SYSTEM] != config[CONF_UNIT_SYSTEM]:
+            hass.async_create_task(hass.config_entries.async_reload(entry.entry_id))
+
+    coordinator.async_on_stop(
+        hass.bus.async_listen(EVENT_CORE_CONFIG_UPDATE, async_core_config_updated))
 
     hass.async_create_task(
         hass.config_entries.async_forward_entry_setup(entry, SENSOR_DOMAIN)
     )
 
+    coordinator.setup_duration = time.monotonic() - started
+    _LOGGER.debug('Set up Polar entry %s in %.3fs', entry.entry_id, coordinator.setup_duration)
+
     return True
 
 
+async def async_update_options(hass, entry):
+    """Reload an entry when its options change."""
+    coordinator = hass.data[DATA_COORDINATORS].get(entry.entry_id)
+
+    if coordinator is not None and coordinator.options == dict(entry.options):
+        return
+
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass, entry):
     """Unload a config entry."""
     _LOGGER.debug('Unloading Polar integration')
 
     await hass.config_entries.async_forward_entry_unload(entry, SENSOR_DOMAIN)
 
+    coordinator = hass.data[DATA_COORDINATORS].pop(entry.entry_id)
+    coordinator.async_stop()
+
     return True
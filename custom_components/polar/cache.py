@@ -0,0 +1,108 @@
+"""Size-bounded cache of AccessLink response bodies."""
+import collections
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+# Item resources never change once created, so cached bodies are served
+# without contacting AccessLink.
+CACHE_IMMUTABLE = 'immutable'
+# Listings change over time; cached bodies are only reused after a
+# conditional request confirms them with 304 Not Modified.
+CACHE_REVALIDATE = 'revalidate'
+
+HEADER_ETAG = 'ETag'
+HEADER_LAST_MODIFIED = 'Last-Modified'
+HEADER_IF_NONE_MATCH = 'If-None-Match'
+HEADER_IF_MODIFIED_SINCE = 'If-Modified-Since'
+
+
+class CacheEntry:
+    """Raw response body and its validators."""
+
+    __slots__ = ('body', 'etag', 'last_modified')
+
+    def __init__(self, body, etag=None, last_modified=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def validated(self):
+        return self.etag is not None or self.last_modified is not None
+
+    def conditional_headers(self):
+        headers = {}
+
+        if self.etag is not None:
+            headers[HEADER_IF_NONE_MATCH] = self.etag
+
+        if self.last_modified is not None:
+            headers[HEADER_IF_MODIFIED_SINCE] = self.last_modified
+
+        return headers
+
+
+class ResponseCache:
+    """LRU cache of response bodies by key, bounded by total body size."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+
+        return entry
+
+    def put(self, key, body, etag=None, last_modified=None):
+        self.discard(key)
+
+        if len(body) > self.max_bytes:
+            return
+
+        self._entries[key] = CacheEntry(body, etag, last_modified)
+        self.size += len(body)
+
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.body)
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= len(entry.body)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.revalidated + self.misses
+        return (self.hits + self.revalidated) / lookups if lookups else None
+
+    @property
+    def stats(self):
+        hit_rate = self.hit_rate
+
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(hit_rate, 3) if hit_rate is not None else None}
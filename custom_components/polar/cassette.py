@@ -0,0 +1,225 @@
+"""Recording and replay of AccessLink HTTP traffic.
+
+A cassette is a gzip-compressed JSON lines file with one exchange per line:
+the request method and URL, the response status, the headers the client
+reads, the body, the recording session, the wall-clock time the request
+started and how long it took. Request headers and bodies are never written,
+and tokens and webhook keys in response bodies are redacted.
+
+Every exchange is written as a complete gzip member, so a cassette appended
+to across restarts stays readable, and a crash can at worst leave a
+truncated final member, which is skipped on read.
+"""
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import json
+import logging
+import time
+import uuid
+import zlib
+
+from multidict import CIMultiDict, CIMultiDictProxy
+
+_LOGGER = logging.getLogger(__name__)
+
+RECORDED_HEADERS = (
+    'Content-Type', 'ETag', 'Last-Modified', 'Retry-After',
+    'RateLimit-Limit', 'RateLimit-Usage', 'RateLimit-Reset')
+
+REDACTED_FIELDS = {'access_token', 'signature_secret_key'}
+REDACTED = 'REDACTED'
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in REDACTED_FIELDS else _redact(item)
+            for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+
+    return value
+
+
+def _encode_body(body):
+    try:
+        text = body.decode()
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(body).decode()}
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {'text': text}
+
+    return {'json': _redact(data)}
+
+
+def _decode_body(entry):
+    if 'json' in entry:
+        return json.dumps(entry['json'], separators=(',', ':')).encode()
+
+    if 'text' in entry:
+        return entry['text'].encode()
+
+    if 'b64' in entry:
+        return base64.b64decode(entry['b64'])
+
+    return b''
+
+
+def read_cassette(path):
+    """Return the exchanges stored in a cassette, in recorded order."""
+    entries = []
+
+    with gzip.open(path, 'rb') as source:
+        try:
+            for line in source:
+                if not line.endswith(b'\n'):
+                    break
+
+                if line.strip():
+                    entries.append(json.loads(line))
+        except (EOFError, OSError, zlib.error, ValueError) as err:
+            _LOGGER.warning(
+                'Ignoring truncated end of cassette %s after %d exchanges: %s', path, len(entries), err)
+
+    return entries
+
+
+class _CassetteContent:
+    """Stand-in for aiohttp's StreamReader over a complete body."""
+
+    def __init__(self, body):
+        self._body = body
+        self.total_bytes = len(body)
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self._body), size):
+            yield self._body[start:start + size]
+
+
+class CassetteResponse:
+    """Response served from, or captured into, a cassette."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content_length = len(body)
+        self.content = _CassetteContent(body)
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def text(self):
+        return self._body.decode(errors='replace')
+
+    async def json(self, content_type=None):
+        return json.loads(self._body)
+
+
+class RecordingSession:
+    """Wraps an aiohttp session and appends every exchange to a cassette.
+
+    Bodies are read in full before being handed to the client, so streamed
+    downloads are buffered while recording.
+    """
+
+    def __init__(self, session, path):
+        self._session = session
+        self._path = path
+        self._session_id = uuid.uuid4().hex[:12]
+        # A single writer thread keeps exchanges in order without blocking the loop.
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._output = None
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        started = time.time()
+        monotonic = time.monotonic()
+
+        async with self._session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            status = response.status
+            headers = {
+                name: response.headers[name]
+                for name in RECORDED_HEADERS if name in response.headers}
+
+        entry = {
+            'i': self._session_id,
+            't': round(started, 3),
+            'd': round(time.monotonic() - monotonic, 3),
+            'm': method,
+            'u': str(url),
+            's': status,
+            'h': headers,
+            **_encode_body(body)}
+
+        await asyncio.get_event_loop().run_in_executor(self._writer, self._write, entry)
+
+        yield CassetteResponse(status, headers, body)
+
+    def _write(self, entry):
+        if self._output is None:
+            self._output = open(self._path, 'ab')
+
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        self._output.write(gzip.compress(line.encode()))
+        self._output.flush()
+
+    def close(self):
+        def close_output():
+            if self._output is not None:
+                self._output.close()
+
+        self._writer.submit(close_output)
+        self._writer.shutdown(wait=True)
+
+
+class ReplaySession:
+    """Serves recorded exchanges back in order, matched by method and URL.
+
+    Each response is delayed by its recorded duration divided by speed, so
+    speed=1 keeps the original timing and speed=0 serves immediately.
+    Requests with nothing left to replay get a 404.
+    """
+
+    def __init__(self, entries, speed=1.0):
+        self.speed = speed
+        self.served = 0
+        self.missed = 0
+        self._queues = collections.defaultdict(collections.deque)
+
+        for entry in entries:
+            self._queues[(entry['m'], entry['u'])].append(entry)
+
+    @classmethod
+    def from_file(cls, path, speed=1.0):
+        return cls(read_cassette(path), speed)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        queue = self._queues.get((method, str(url)))
+
+        if not queue:
+            self.missed += 1
+            _LOGGER.warning('No recorded response left for %s %s', method, url)
+            yield CassetteResponse(404, {}, b'Not in cassette')
+            return
+
+        entry = queue.popleft()
+        self.served += 1
+
+        if self.speed:
+            await asyncio.sleep(entry['d'] / self.speed)
+
+        yield CassetteResponse(entry['s'], entry['h'], _decode_body(entry))
+
+    def close(self):
+        pass
@@ -0,0 +1,296 @@
+"""Asynchronous client for the Polar AccessLink API."""
+import asyncio
+import json
+import logging
+import time
+import urllib.parse
+
+import aiohttp
+
+from .cache import (
+    CACHE_IMMUTABLE, CACHE_REVALIDATE, HEADER_ETAG, HEADER_LAST_MODIFIED)
+from .const import (
+    ACCESSLINK_URL, AUTHORIZATION_URL, ACCESS_TOKEN_URL, TRANSACTION_SEGMENT)
+from .scheduler import (
+    PRIORITY_COMMIT, PRIORITY_LIST, PRIORITY_GET, HEADER_RETRY_AFTER, MAX_RETRIES)
+
+_LOGGER = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Failures reaching AccessLink at all, as opposed to errors it returns.
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class PolarApiError(Exception):
+    """Error returned by the Polar AccessLink API."""
+
+    def __init__(self, status, message):
+        super().__init__(f"AccessLink request failed ({status}): {message}")
+        self.status = status
+
+
+class RequestCounter:
+    """Requests, bytes received and time spent waiting on AccessLink."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, seconds, size):
+        self.requests += 1
+        self.bytes += size
+        self.seconds += seconds
+
+
+class AccessLinkClient:
+    """Non-blocking AccessLink client built on a shared aiohttp session."""
+
+    def __init__(self, session, client_id, client_secret, redirect_url=None, scheduler=None,
+                 base_url=ACCESSLINK_URL, token_url=ACCESS_TOKEN_URL, cache=None):
+        self._session = session
+        self._cache = cache
+        self._base_url = base_url
+        self._token_url = token_url
+        self._scheduler = scheduler
+        self._notifications = None
+        self._notifications_time = 0.0
+        self._notifications_task = None
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._redirect_url = redirect_url
+
+    @property
+    def client_id(self):
+        return self._client_id
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def _client_auth(self):
+        return aiohttp.BasicAuth(self._client_id, self._client_secret)
+
+    @staticmethod
+    def _bearer(access_token):
+        return {'Authorization': f"Bearer {access_token}"}
+
+    def get_authorization_url(self, state=None):
+        params = {
+            'response_type': 'code',
+            'client_id': self._client_id}
+
+        if self._redirect_url:
+            params['redirect_uri'] = self._redirect_url
+
+        if state:
+            params['state'] = state
+
+        return f"{AUTHORIZATION_URL}?{urllib.parse.urlencode(params)}"
+
+    async def request(self, method, url, auth=None, headers=None, priority=PRIORITY_LIST,
+                      counter=None, cache=None, **kwargs):
+        """Perform a request and return the decoded JSON body, if any.
+
+        GET requests with a cache policy go through the response cache, when
+        the client has one.
+        """
+        if cache is not None and self._cache is not None and method == 'GET':
+            body = await self._cached_get(url, auth, headers, priority, counter, cache)
+            return json.loads(body) if body else None
+
+        async def handle(response):
+            if response.status == 204 or response.content_length == 0:
+                return None
+
+            return await response.json(content_type=None)
+
+        return await self._send(method, url, handle, auth, headers, priority, counter, **kwargs)
+
+    async def _cached_get(self, url, auth, headers, priority, counter, policy):
+        if not url.startswith('http'):
+            url = f"{self._base_url}{url}"
+
+        key = TRANSACTION_SEGMENT.sub('', url) if policy == CACHE_IMMUTABLE else url
+        entry = self._cache.get(key)
+
+        if entry is not None and policy == CACHE_IMMUTABLE:
+            self._cache.hits += 1
+            return entry.body
+
+        conditional = entry.conditional_headers() if entry is not None else {}
+
+        async def handle(response):
+            if response.status == 304 and entry is not None:
+                self._cache.revalidated += 1
+                return entry.body
+
+            self._cache.misses += 1
+
+            if response.status == 204:
+                self._cache.discard(key)
+                return None
+
+            body = await response.read()
+            etag = response.headers.get(HEADER_ETAG)
+            last_modified = response.headers.get(HEADER_LAST_MODIFIED)
+
+            if body and (policy == CACHE_IMMUTABLE or etag or last_modified):
+                self._cache.put(key, body, etag, last_modified)
+
+            return body
+
+        return await self._send(
+            'GET', url, handle, auth, {**(headers or {}), **conditional}, priority, counter)
+
+    async def stream(self, url, consume, headers=None, accept='application/json',
+                     priority=PRIORITY_GET, counter=None):
+        """Perform a GET request and pass the body to consume() chunk by chunk."""
+        async def handle(response):
+            if response.status == 204:
+                return None
+
+            return await consume(response.content.iter_chunked(STREAM_CHUNK_SIZE))
+
+        return await self._send(
+            'GET', url, handle, None, {'Accept': accept, **(headers or {})}, priority, counter)
+
+    async def _send(self, method, url, handle, auth, headers, priority, counter=None, **kwargs):
+        if not url.startswith('http'):
+            url = f"{self._base_url}{url}"
+
+        request_headers = {'Accept': 'application/json'}
+        request_headers.update(headers or {})
+
+        for attempt in range(MAX_RETRIES + 1):
+            if self._scheduler is not None:
+                await self._scheduler.acquire(priority)
+
+            sent = time.monotonic()
+
+            async with self._session.request(
+                    method, url, auth=auth, headers=request_headers, **kwargs) as response:
+                if self._scheduler is not None:
+                    self._scheduler.update_from_headers(response.headers)
+
+                    if response.status == 429 and attempt < MAX_RETRIES:
+                        retry_after = response.headers.get(HEADER_RETRY_AFTER)
+                        self._scheduler.backoff(
+                            attempt, int(retry_after) if retry_after and retry_after.isdigit() else None)
+                        continue
+
+                if response.status >= 400:
+                    raise PolarApiError(response.status, await response.text())
+
+                result = await handle(response)
+
+                if counter is not None:
+                    counter.record(time.monotonic() - sent, response.content.total_bytes)
+
+                return result
+
+    async def get_access_token(self, authorization_code):
+        data = {
+            'grant_type': 'authorization_code',
+            'code': authorization_code}
+
+        if self._redirect_url:
+            data['redirect_uri'] = self._redirect_url
+
+        return await self.request(
+            'POST', self._token_url, auth=self._client_auth, data=data)
+
+    async def register_user(self, user_id, access_token):
+        return await self.request(
+            'POST', '/users',
+            headers=self._bearer(access_token),
+            json={'member-id': str(user_id)})
+
+    async def create_transaction(self, endpoint_type, user_id, access_token, counter=None):
+        result = await self.request(
+            'POST', f"/users/{user_id}/{endpoint_type.transaction_path}",
+            headers=self._bearer(access_token), counter=counter)
+
+        if result is None:
+            return None
+
+        return AccessLinkTransaction(self, result['resource-uri'], access_token, counter)
+
+    async def list_available_data(self):
+        """Return the pull notifications for all users of this client."""
+        result = await self.request(
+            'GET', '/notifications', auth=self._client_auth, cache=CACHE_REVALIDATE)
+        return (result or {}).get('available-user-data', [])
+
+    async def list_available_data_shared(self, max_age):
+        """Return pull notifications, shared by every user polled within max_age seconds."""
+        if self._notifications is not None and time.monotonic() - self._notifications_time < max_age:
+            return self._notifications
+
+        if self._notifications_task is None:
+            self._notifications_task = asyncio.ensure_future(self.list_available_data())
+
+        task = self._notifications_task
+
+        try:
+            self._notifications = await asyncio.shield(task)
+            self._notifications_time = time.monotonic()
+        finally:
+            if self._notifications_task is task and task.done():
+                self._notifications_task = None
+
+        return self._notifications
+
+    async def list_webhooks(self):
+        result = await self.request('GET', '/webhooks', auth=self._client_auth)
+        return (result or {}).get('data', [])
+
+    async def create_webhook(self, url, events):
+        result = await self.request(
+            'POST', '/webhooks', auth=self._client_auth,
+            json={'events': list(events), 'url': url})
+        return result['data']
+
+    async def delete_webhook(self, webhook_id):
+        await self.request(
+            'DELETE', f"/webhooks/{webhook_id}", auth=self._client_auth)
+
+
+class AccessLinkTransaction:
+    """Open AccessLink transaction for a single user and data type."""
+
+    def __init__(self, client, url, access_token, counter=None):
+        self._client = client
+        self._url = url
+        self._headers = AccessLinkClient._bearer(access_token)
+        self.counter = counter if counter is not None else RequestCounter()
+
+    @property
+    def url(self):
+        return self._url
+
+    async def list_items(self):
+        return await self._client.request(
+            'GET', self._url, headers=self._headers, priority=PRIORITY_LIST,
+            counter=self.counter)
+
+    async def get_item(self, url, cache=None):
+        return await self._client.request(
+            'GET', url, headers=self._headers, priority=PRIORITY_GET,
+            counter=self.counter, cache=cache)
+
+    async def stream_item(self, url, consume, accept='application/json'):
+        return await self._client.stream(
+            url, consume, headers=self._headers, accept=accept, priority=PRIORITY_GET,
+            counter=self.counter)
+
+    async def commit(self):
+        await self._client.request(
+            'PUT', self._url, headers=self._headers, priority=PRIORITY_COMMIT,
+            counter=self.counter)
@@ -4,30 +4,34 @@ import logging
 from collections import OrderedDict
 
 import aiohttp
-import requests
 import voluptuous as vol
 
 from homeassistant import config_entries, data_entry_flow
 from homeassistant.core import callback
 from homeassistant.helpers import config_entry_flow
 from homeassistant.components.http import HomeAssistantView
+import homeassistant.helpers.config_validation as cv
 
-from accesslink import AccessLink
-
+from .client import AccessLinkClient, PolarApiError
 from .const import (
     DOMAIN, CONF_CLIENT_ID, CONF_CLIENT_SECRET, CONF_USER_ID,
-    CONF_ACCESS_TOKEN, AUTH_CALLBACK_NAME, AUTH_CALLBACK_PATH)
+    CONF_ACCESS_TOKEN, AUTH_CALLBACK_NAME, AUTH_CALLBACK_PATH, CONF_UNIT_SYSTEM,
+    CONF_MONITORED_RESOURCES, SYSTEM_METRIC, SYSTEM_IMPERIAL, ENDPOINTS,
+    RESOURCE_NAMES)
+from .helpers import entry_options, client_session
 
 _LOGGER = logging.getLogger(__name__)
 
-has_oauth_callback = False
+DATA_AUTH_CALLBACK_VIEW = 'polar_auth_callback_view'
 
 def setup_oauth_callback(hass):
     callback_url = f"{hass.config.api.base_url}{AUTH_CALLBACK_PATH}"
 
-    if not has_oauth_callback:
+    # Views cannot be unregistered, so register once per Home Assistant instance.
+    if not hass.data.get(DATA_AUTH_CALLBACK_VIEW):
         hass.http.register_view(PolarAuthCallbackView())
-    
+        hass.data[DATA_AUTH_CALLBACK_VIEW] = True
+
     return callback_url
 
 @config_entries.HANDLERS.register(DOMAIN)
@@ -39,12 +43,18 @@ class PolarConfigFlow(config_entries.ConfigFlow):
         self.data = None
         self.accesslink_client = None
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return PolarOptionsFlow(config_entry)
+
     @property
     def accesslink(self):
         callback_url = setup_oauth_callback(self.hass)
 
         if not self.accesslink_client:
-            self.accesslink_client = AccessLink(
+            self.accesslink_client = AccessLinkClient(
+                client_session(self.hass),
                 client_id=self.data[CONF_CLIENT_ID],
                 client_secret=self.data[CONF_CLIENT_SECRET],
                 redirect_url=callback_url)
@@ -94,7 +104,7 @@ class PolarConfigFlow(config_entries.ConfigFlow):
                 url=self.accesslink.get_authorization_url(state=self.flow_id)
             )
 
-        token_response = self.accesslink.get_access_token(user_input['code'])
+        token_response = await self.accesslink.get_access_token(user_input['code'])
 
         self.data[CONF_USER_ID] = token_response['x_user_id']
         self.data[CONF_ACCESS_TOKEN] = token_response['access_token']
@@ -104,18 +114,52 @@ class PolarConfigFlow(config_entries.ConfigFlow):
     async def async_step_finish(self, user_input=None):
         data = user_input or self.data or {}
 
+        # Each Polar account can only be set up once.
+        await self.async_set_unique_id(str(data[CONF_USER_ID]))
+        self._abort_if_unique_id_configured()
+
         try:
-            self.accesslink.users.register(access_token=data[CONF_ACCESS_TOKEN])
-        except requests.exceptions.HTTPError as err:
+            await self.accesslink.register_user(data[CONF_USER_ID], data[CONF_ACCESS_TOKEN])
+        except PolarApiError as err:
             # Error 409 Conflict means that the user has already been registered for this client, which is okay.
-            if err.response.status_code != 409:
+            if err.status != 409:
                 raise err
 
         return self.async_create_entry(
-            title='Polar',
+            title=f"Polar {data[CONF_USER_ID]}",
             data=data
         )
 
+class PolarOptionsFlow(config_entries.OptionsFlow):
+    """Per-account unit system and monitored resources."""
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(
+                title='',
+                data={
+                    CONF_UNIT_SYSTEM: user_input[CONF_UNIT_SYSTEM],
+                    CONF_MONITORED_RESOURCES: {
+                        endpoint: user_input[endpoint]
+                        for endpoint in ENDPOINTS
+                        if user_input.get(endpoint)}})
+
+        current = entry_options(self.hass, self.config_entry)
+        resources = current[CONF_MONITORED_RESOURCES]
+
+        data_schema = OrderedDict()
+        data_schema[vol.Required(CONF_UNIT_SYSTEM, default=current[CONF_UNIT_SYSTEM])] = \
+            vol.In([SYSTEM_METRIC, SYSTEM_IMPERIAL])
+
+        for endpoint in ENDPOINTS:
+            data_schema[vol.Optional(endpoint, default=list(resources.get(endpoint, [])))] = \
+                cv.multi_select(list(RESOURCE_NAMES[endpoint]))
+
+        return self.async_show_form(step_id='init', data_schema=vol.Schema(data_schema))
+
 class PolarAuthCallbackView(HomeAssistantView):
     """Polar Accesslink Authorization Callback View."""
 
@@ -1,7 +1,74 @@
+import collections
 import datetime
-import isodate
+import functools
+import re
 
 DOMAIN = 'polar'
+MANUFACTURER = 'Polar'
+
+DATA_COORDINATORS = 'polar_coordinators'
+DATA_CLIENTS = 'polar_clients'
+DATA_SESSION = 'polar_session'
+
+STORE_DIRECTORY = '.storage/polar'
+
+SAMPLES_DIRECTORY = 'samples'
+ACTIVITY_SAMPLES_DIRECTORY = 'activity'
+
+EXPORT_DIRECTORY = 'polar_export'
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMAT_CSV = 'csv'
+EXPORT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW, FORMAT_CSV)
+
+# AccessLink sample-type codes
+SAMPLE_HEART_RATE = '0'
+SAMPLE_SPEED = '1'
+SAMPLE_POWER = '4'
+
+SAMPLE_HR_ZONES = 'hr-zone'
+SAMPLE_MAX_POWER = 'max-60s-power'
+SAMPLE_BEST_SPEED = 'best-60s-speed'
+SAMPLE_BEST_PACE = 'best-60s-pace'
+
+# Intraday daily-activity series
+SERIES_STEPS = 'steps-today'
+SERIES_SEDENTARY = 'sedentary-today'
+ACTIVITY_SAMPLE_SERIES = (SERIES_STEPS, SERIES_SEDENTARY)
+
+SERVICE_IMPORT_HISTORY = 'import_history'
+SERVICE_PROFILE_UPDATE = 'profile_update'
+SERVICE_EXPORT = 'export'
+
+ATTR_ENTRY_ID = 'entry_id'
+ATTR_FORMAT = 'format'
+ATTR_INCREMENTAL = 'incremental'
+
+DIAG_DURATION = 'poll-duration'
+DIAG_NETWORK_TIME = 'network-time'
+DIAG_PROCESSING_TIME = 'processing-time'
+DIAG_ITEMS = 'items'
+DIAG_BYTES = 'bytes'
+DIAG_COMMIT_LATENCY = 'commit-latency'
+DIAG_ERRORS = 'errors'
+DIAG_DATA_AGE = 'data-age'
+
+STATISTICS_STORAGE_KEY = 'polar_statistics_{}'
+STATISTICS_STORAGE_VERSION = 1
+
+SCHEDULE_STORAGE_KEY = 'polar_schedule_{}'
+SCHEDULE_STORAGE_VERSION = 1
+
+EXPORT_STORAGE_KEY = 'polar_export_{}'
+EXPORT_STORAGE_VERSION = 1
+
+STAT_ACUTE_TRAINING_LOAD = 'acute-training-load'
+STAT_CHRONIC_TRAINING_LOAD = 'chronic-training-load'
+STAT_TRAINING_LOAD_RATIO = 'training-load-ratio'
+STAT_WEEKLY_DISTANCE = 'weekly-distance'
+STAT_WEEKLY_DURATION = 'weekly-duration'
+STAT_WEEKLY_CALORIES = 'weekly-calories'
 
 CONF_CLIENT_ID = 'client_id'
 CONF_CLIENT_SECRET = 'client_secret'
@@ -12,58 +79,156 @@ CONF_MONITORED_RESOURCES = 'monitored_resources'
 CONF_DAILY_ACTIVITY = 'daily_activity'
 CONF_TRAINING_DATA = 'training_data'
 CONF_PHYSICAL_INFO = 'physical_info'
+CONF_FETCH_CONCURRENCY = 'fetch_concurrency'
+CONF_WEBHOOK = 'webhook'
+CONF_WEBHOOK_ID = 'webhook_id'
+CONF_WEBHOOK_SECRET = 'webhook_secret'
+CONF_STATISTICS = 'statistics'
+CONF_EXERCISE_SAMPLES = 'exercise_samples'
+CONF_ACTIVITY_SAMPLES = 'activity_samples'
+CONF_DIAGNOSTICS = 'diagnostics'
+CONF_ADAPTIVE_POLLING = 'adaptive_polling'
+CONF_MIN_SCAN_INTERVAL = 'min_scan_interval'
+CONF_MAX_SCAN_INTERVAL = 'max_scan_interval'
+CONF_CASSETTE_MODE = 'cassette_mode'
+CONF_CASSETTE_PATH = 'cassette_path'
+CONF_REPLAY_SPEED = 'replay_speed'
+
+DEFAULT_FETCH_CONCURRENCY = 4
+DEFAULT_MIN_SCAN_INTERVAL = 10
+DEFAULT_MAX_SCAN_INTERVAL = 240
+DEFAULT_CASSETTE_PATH = 'polar_cassette.jsonl.gz'
+DEFAULT_REPLAY_SPEED = 1.0
+
+CASSETTE_MODE_RECORD = 'record'
+CASSETTE_MODE_REPLAY = 'replay'
 
 AUTH_CALLBACK_NAME = "api:polar_auth"
 AUTH_CALLBACK_PATH = "/api/polar_auth"
 
+WEBHOOK_NAME = "api:polar_webhook"
+WEBHOOK_PATH = "/api/polar_webhook"
+WEBHOOK_SIGNATURE_HEADER = 'Polar-Webhook-Signature'
+WEBHOOK_PING = 'PING'
+WEBHOOK_EVENTS = {
+    'EXERCISE': CONF_TRAINING_DATA,
+    'ACTIVITY_SUMMARY': CONF_DAILY_ACTIVITY}
+
+SIGNAL_WEBHOOK_UPDATE = 'polar_webhook_update_{}_{}'
+
+ACCESSLINK_URL = 'https://www.polaraccesslink.com/v3'
+AUTHORIZATION_URL = 'https://flow.polar.com/oauth2/authorization'
+ACCESS_TOKEN_URL = 'https://polarremote.com/v2/oauth2/token'
+
 SYSTEM_IMPERIAL = 'imperial'
 SYSTEM_METRIC = 'metric'
 
-class PolarEndpointType:
-    """Base class for modeling Polar endpoints."""
+class PolarEndpointType(collections.namedtuple(
+        'PolarEndpointType',
+        'name result_name timestamp_name transaction_path data_type event_type cacheable',
+        defaults=(False,))):
+    """Immutable description of a Polar endpoint, shared by every entry."""
 
-    def __init__(self, name, result_name, timestamp_name, list_method, get_method):
-        self.name = name
-        self.result_name = result_name
-        self.timestamp_name = timestamp_name
-        self.list_method = list_method
-        self.get_method = get_method
+    __slots__ = ()
 
 ENDPOINTS = {
     CONF_DAILY_ACTIVITY: PolarEndpointType(
         'daily_activity',
         'activity-log',
         'created',
-        'list_activities',
-        'get_activity_summary'),
+        'activity-transactions',
+        'ACTIVITY_SUMMARY',
+        'polar_new_activity'),
     CONF_TRAINING_DATA: PolarEndpointType(
         'training_data',
         'exercises',
         'start-time',
-        'list_exercises',
-        'get_exercise_summary'),
+        'exercise-transactions',
+        'EXERCISE',
+        'polar_new_exercise'),
     CONF_PHYSICAL_INFO: PolarEndpointType(
         'physical_info',
         'physical-informations',
         'created',
-        'list_physical_infos',
-        'get_physical_info')}
+        'physical-information-transactions',
+        'PHYSICAL_INFORMATION',
+        'polar_new_physical_info',
+        cacheable=True)}
+
+class PolarResource(collections.namedtuple('PolarResource', 'name friendly_name units icon')):
+    """Immutable description of one Polar value, shared by every entry's sensors."""
+
+    __slots__ = ()
+
+try:
+    from homeassistant.components.sensor import SensorDeviceClass
+    DEVICE_CLASS_DISTANCE = SensorDeviceClass.DISTANCE
+    DEVICE_CLASS_WEIGHT = SensorDeviceClass.WEIGHT
+    DEVICE_CLASS_DURATION = SensorDeviceClass.DURATION
+except ImportError:
+    DEVICE_CLASS_DISTANCE = 'distance'
+    DEVICE_CLASS_WEIGHT = 'weight'
+    DEVICE_CLASS_DURATION = 'duration'
+
+try:
+    from homeassistant.const import UnitOfTime
+    UNIT_MINUTES = UnitOfTime.MINUTES
+    UNIT_SECONDS = UnitOfTime.SECONDS
+except ImportError:
+    UNIT_MINUTES = 'min'
+    UNIT_SECONDS = 's'
+
+def _freeze(value):
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+class SharedUnit:
+    """Base for units, which are immutable and interned.
 
-class PolarResource:
-    """Base class for modeling Polar data."""
+    Constructing a unit equal to an existing one returns the existing object,
+    so resources and extractors across entries share a single instance.
+    """
 
-    def __init__(self, name, friendly_name, units, icon):
-        """Constructor."""
-        self.name = name
-        self.friendly_name = friendly_name
-        self.units = units
-        self.icon = icon
+    __slots__ = ()
+    _instances = {}
 
-class SimpleUnit:
+    def __new__(cls, *args):
+        key = (cls,) + tuple(_freeze(arg) for arg in args)
+        instance = SharedUnit._instances.get(key)
+
+        if instance is None:
+            instance = SharedUnit._instances[key] = super().__new__(cls)
+            instance._setup(*args)
+
+        return instance
+
+    def _setup(self):
+        pass
+
+    @property
+    def device_class(self):
+        return None
+
+    @property
+    def precision(self):
+        return None
+
+class SimpleUnit(SharedUnit):
     """Simple class for units that are the same under both imperial and metric systems"""
 
-    def __init__(self, unit):
+    __slots__ = ('_unit', '_device_class', '_precision')
+
+    def _setup(self, unit, device_class=None, precision=None):
         self._unit = unit
+        self._device_class = device_class
+        self._precision = precision
+
+    @property
+    def device_class(self):
+        return self._device_class
+
+    @property
+    def precision(self):
+        return self._precision
 
     def unit(self, system):
         return self._unit
@@ -71,34 +236,169 @@ class SimpleUnit:
     def parse(self, raw, system):
         return raw
 
+    def parser(self, system):
+        return _identity
+
+    def restore(self, state):
+        """Return a value from its restored state string."""
+        return _number(state) if self._unit is not None else state
 
-class ScaledUnit:
-    def __init__(self, units, conversions, precision):
+class ScaledUnit(SharedUnit):
+    """Numeric unit scaled from the AccessLink value by a per-system factor.
+
+    Factors are inverted once here, so parsing is a single multiply. Values
+    are returned unrounded; precision is only a display hint.
+    """
+
+    __slots__ = ('_units', '_factors', '_precision', '_device_class')
+
+    def _setup(self, units, conversions, precision, device_class=None):
         self._units = units
-        self._conversions = conversions
+        self._factors = {system: 1 / conversion for system, conversion in conversions.items()}
         self._precision = precision
+        self._device_class = device_class
+
+    @property
+    def device_class(self):
+        return self._device_class
+
+    @property
+    def precision(self):
+        return self._precision
 
     def unit(self, system):
         return self._units[system]
 
     def parse(self, raw, system):
-        return format(raw / self._conversions[system], f".{self._precision}f")
+        return self.parser(system)(raw)
+
+    def parser(self, system):
+        factor = self._factors[system]
+
+        if factor == 1:
+            return _identity
+
+        return lambda raw: raw * factor
+
+    def restore(self, state):
+        return _number(state)
+
+class TimestampUnit(SharedUnit):
+    __slots__ = ()
 
-class TimestampUnit:
     def unit(self, system):
         return None
 
     def parse(self, raw, system):
-        value = datetime.datetime.fromisoformat(raw)
-        return value
+        return parse_timestamp(raw)
+
+    def parser(self, system):
+        return parse_timestamp
+
+    def restore(self, state):
+        return parse_timestamp(state) if isinstance(state, str) else None
+
+class DurationUnit(SharedUnit):
+    """ISO 8601 duration in minutes, shown as whole minutes."""
+
+    __slots__ = ()
+
+    @property
+    def device_class(self):
+        return DEVICE_CLASS_DURATION
+
+    @property
+    def precision(self):
+        return 0
 
-class DurationUnit:
     def unit(self, system):
-        return 'minutes'
+        return UNIT_MINUTES
 
     def parse(self, raw, system):
-        value = isodate.parse_duration(raw)
-        return format(value.total_seconds() / 60, '.0f')
+        return _duration_minutes(raw)
+
+    def parser(self, system):
+        return _duration_minutes
+
+    def restore(self, state):
+        return _number(state)
+
+def _duration_minutes(raw):
+    return parse_duration(raw).total_seconds() / 60
+
+def _number(state):
+    """Parse a restored numeric state, or None for unknown and unavailable."""
+    for parse in (int, float):
+        try:
+            return parse(state)
+        except (TypeError, ValueError):
+            pass
+
+    return None
+
+def _identity(raw):
+    return raw
+
+# AccessLink durations only use hours, minutes and seconds, e.g. PT1H2M3.5S.
+DURATION_PATTERN = re.compile(r'PT(?=\d)(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?')
+# Timestamps fromisoformat may reject before Python 3.11: a trailing Z, or a
+# fraction of other than 3 or 6 digits.
+TIMESTAMP_PATTERN = re.compile(
+    r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?')
+
+# Item URLs embed the transaction that listed them; the item itself does not
+# change when a later transaction lists it again.
+TRANSACTION_SEGMENT = re.compile(r'/[a-z-]+-transactions/\d+(?=/)')
+
+# Payload values repeat across sensors, stored records and zone samples, so
+# recent results are memoized. Both results are immutable.
+PARSE_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_duration(raw):
+    """Parse an ISO 8601 duration, falling back to isodate for unusual forms."""
+    match = DURATION_PATTERN.fullmatch(raw)
+
+    if match is None:
+        from isodate import parse_duration as parse
+        return parse(raw)
+
+    hours, minutes, seconds = match.groups()
+
+    return datetime.timedelta(
+        hours=int(hours or 0), minutes=int(minutes or 0), seconds=float(seconds or 0))
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_timestamp(raw):
+    """Parse an ISO 8601 timestamp, or return None if it is not one.
+
+    Timestamps with a Z or an offset are timezone-aware; AccessLink's local
+    times without one are returned naive.
+    """
+    try:
+        return datetime.datetime.fromisoformat(raw)
+    except ValueError:
+        pass
+
+    match = TIMESTAMP_PATTERN.fullmatch(raw)
+
+    if match is None:
+        return None
+
+    value, fraction, zone = match.groups()
+
+    if fraction:
+        value = f"{value}.{fraction[:6].ljust(6, '0')}"
+
+    if zone == 'Z':
+        zone = '+00:00'
+    elif zone and ':' not in zone:
+        zone = f"{zone[:3]}:{zone[3:]}"
+
+    try:
+        return datetime.datetime.fromisoformat(value + (zone or ''))
+    except ValueError:
+        return None
 
 RESOURCES = {
     CONF_DAILY_ACTIVITY: [
@@ -148,8 +448,9 @@ RESOURCES = {
             'Distance',
             ScaledUnit(
                 { SYSTEM_IMPERIAL: 'mi', SYSTEM_METRIC: 'km' },
-                { SYSTEM_IMPERIAL: 1609.34, SYSTEM_METRIC: 1000 },
-                2),
+                { SYSTEM_IMPERIAL: 1609.344, SYSTEM_METRIC: 1000 },
+                2,
+                DEVICE_CLASS_DISTANCE),
             'mdi:map-marker'),
         PolarResource(
             'heart-rate/average',
@@ -196,17 +497,20 @@ RESOURCES = {
             'weight',
             'Weight',
             ScaledUnit(
-                { SYSTEM_IMPERIAL: 'lbs', SYSTEM_METRIC: 'kg' },
-                { SYSTEM_IMPERIAL: 0.453592, SYSTEM_METRIC: 1 },
-                1),
+                { SYSTEM_IMPERIAL: 'lb', SYSTEM_METRIC: 'kg' },
+                { SYSTEM_IMPERIAL: 0.45359237, SYSTEM_METRIC: 1 },
+                1,
+                DEVICE_CLASS_WEIGHT),
             'mdi:human'),
         PolarResource(
             'height',
             'Height',
             ScaledUnit(
+                # AccessLink reports height in centimetres.
                 { SYSTEM_IMPERIAL: 'ft', SYSTEM_METRIC: 'm' },
                 { SYSTEM_IMPERIAL: 30.48, SYSTEM_METRIC: 100 },
-                1),
+                2,
+                DEVICE_CLASS_DISTANCE),
             'mdi:human'),
         PolarResource(
             'maximum-heart-rate',
@@ -234,6 +538,131 @@ RESOURCES = {
             SimpleUnit('L/min'),
             None)]}
 
+STATISTICS = {
+    CONF_TRAINING_DATA: [
+        PolarResource(
+            STAT_ACUTE_TRAINING_LOAD,
+            'Acute Training Load',
+            ScaledUnit(
+                { SYSTEM_IMPERIAL: None, SYSTEM_METRIC: None },
+                { SYSTEM_IMPERIAL: 1, SYSTEM_METRIC: 1 },
+                0),
+            'mdi:run'),
+        PolarResource(
+            STAT_CHRONIC_TRAINING_LOAD,
+            'Chronic Training Load',
+            ScaledUnit(
+                { SYSTEM_IMPERIAL: None, SYSTEM_METRIC: None },
+                { SYSTEM_IMPERIAL: 1, SYSTEM_METRIC: 1 },
+                0),
+            'mdi:run'),
+        PolarResource(
+            STAT_TRAINING_LOAD_RATIO,
+            'Training Load Ratio',
+            ScaledUnit(
+                { SYSTEM_IMPERIAL: None, SYSTEM_METRIC: None },
+                { SYSTEM_IMPERIAL: 1, SYSTEM_METRIC: 1 },
+                2),
+            'mdi:run'),
+        PolarResource(
+            STAT_WEEKLY_DISTANCE,
+            'Weekly Distance',
+            ScaledUnit(
+                { SYSTEM_IMPERIAL: 'mi', SYSTEM_METRIC: 'km' },
+                { SYSTEM_IMPERIAL: 1609.344, SYSTEM_METRIC: 1000 },
+                2,
+                DEVICE_CLASS_DISTANCE),
+            'mdi:map-marker'),
+        PolarResource(
+            STAT_WEEKLY_DURATION,
+            'Weekly Duration',
+            ScaledUnit(
+                { SYSTEM_IMPERIAL: UNIT_MINUTES, SYSTEM_METRIC: UNIT_MINUTES },
+                { SYSTEM_IMPERIAL: 1, SYSTEM_METRIC: 1 },
+                0,
+                DEVICE_CLASS_DURATION),
+            'mdi:clock')],
+    CONF_DAILY_ACTIVITY: [
+        PolarResource(
+            STAT_WEEKLY_CALORIES,
+            'Weekly Calories',
+            SimpleUnit('kcal'),
+            'mdi:fire')]}
+
+SAMPLE_RESOURCES = [
+    *(PolarResource(
+        f"{SAMPLE_HR_ZONES}-{zone}",
+        f"Heart Rate Zone {zone} Time",
+        SimpleUnit(UNIT_MINUTES, DEVICE_CLASS_DURATION, 1),
+        'mdi:heart-pulse') for zone in range(1, 6)),
+    PolarResource(
+        SAMPLE_MAX_POWER,
+        'Max 60s Power',
+        SimpleUnit('W'),
+        'mdi:flash'),
+    PolarResource(
+        SAMPLE_BEST_PACE,
+        'Best 60s Pace',
+        ScaledUnit(
+            { SYSTEM_IMPERIAL: 'min/mi', SYSTEM_METRIC: 'min/km' },
+            { SYSTEM_IMPERIAL: 1, SYSTEM_METRIC: 1 },
+            2),
+        'mdi:run-fast')]
+
+ACTIVITY_SAMPLE_RESOURCES = [
+    PolarResource(
+        SERIES_STEPS,
+        'Steps Today',
+        SimpleUnit('steps'),
+        'mdi:walk'),
+    PolarResource(
+        SERIES_SEDENTARY,
+        'Sedentary Minutes Today',
+        SimpleUnit(UNIT_MINUTES, DEVICE_CLASS_DURATION),
+        'mdi:seat-recline-normal')]
+
+DIAGNOSTICS = [
+    PolarResource(
+        DIAG_DURATION,
+        'Poll Duration',
+        SimpleUnit(UNIT_SECONDS, DEVICE_CLASS_DURATION),
+        'mdi:timer-outline'),
+    PolarResource(
+        DIAG_NETWORK_TIME,
+        'Network Time',
+        SimpleUnit(UNIT_SECONDS, DEVICE_CLASS_DURATION),
+        'mdi:cloud-download'),
+    PolarResource(
+        DIAG_PROCESSING_TIME,
+        'Processing Time',
+        SimpleUnit(UNIT_SECONDS, DEVICE_CLASS_DURATION),
+        'mdi:cpu-64-bit'),
+    PolarResource(
+        DIAG_ITEMS,
+        'Items per Transaction',
+        SimpleUnit('items'),
+        'mdi:format-list-numbered'),
+    PolarResource(
+        DIAG_BYTES,
+        'Bytes Downloaded',
+        SimpleUnit('B'),
+        'mdi:download'),
+    PolarResource(
+        DIAG_COMMIT_LATENCY,
+        'Commit Latency',
+        SimpleUnit(UNIT_SECONDS, DEVICE_CLASS_DURATION),
+        'mdi:timer-check-outline'),
+    PolarResource(
+        DIAG_ERRORS,
+        'Update Errors',
+        SimpleUnit('errors'),
+        'mdi:alert-circle'),
+    PolarResource(
+        DIAG_DATA_AGE,
+        'Time Since Last Data',
+        SimpleUnit(UNIT_MINUTES, DEVICE_CLASS_DURATION),
+        'mdi:clock-alert-outline')]
+
 RESOURCES_BY_NAME = {
     endpoint: { resource.name: resource for resource in resources }
         for endpoint, resources in RESOURCES.items() }
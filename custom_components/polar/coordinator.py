@@ -0,0 +1,468 @@
+"""Update coordination for Polar AccessLink endpoints."""
+import asyncio
+import datetime
+import logging
+import time
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
+from homeassistant.core import CoreState, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+
+from .cache import CACHE_IMMUTABLE
+from .client import PolarApiError, RequestCounter, TRANSPORT_ERRORS
+from .metrics import PolarMetrics
+from .polling import SyncSchedule
+from .const import (
+    ENDPOINTS, DEFAULT_FETCH_CONCURRENCY, SIGNAL_WEBHOOK_UPDATE,
+    SCHEDULE_STORAGE_KEY, SCHEDULE_STORAGE_VERSION, parse_duration, parse_timestamp,
+    CONF_TRAINING_DATA, CONF_PHYSICAL_INFO, CONF_DAILY_ACTIVITY)
+from .store import JOURNAL_OPENED, JOURNAL_STORED, JOURNAL_COMMITTED
+
+_LOGGER = logging.getLogger(__name__)
+
+SCAN_INTERVAL = datetime.timedelta(minutes=30)
+WEBHOOK_SCAN_INTERVAL = datetime.timedelta(hours=6)
+
+# Entries start polling at a fixed offset within this window, so many
+# accounts do not poll in the same second but can still share one
+# notification check per cycle.
+STAGGER_WINDOW = 120
+
+SCHEDULE_SAVE_DELAY = 60
+
+MIN_TIMESTAMP = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+
+class PolarEndpoint:
+    """Wrapper class for standardizing calls to Polar endpoints."""
+
+    def __init__(self, accesslink, endpoint_type, user_id, access_token,
+                 concurrency=DEFAULT_FETCH_CONCURRENCY):
+        self._accesslink = accesslink
+        self._endpoint = endpoint_type
+        self._user_id = user_id
+        self._access_token = access_token
+        self._concurrency = concurrency
+        self._transaction = None
+
+    @property
+    def name(self):
+        return self._endpoint.name
+
+    @property
+    def user_id(self):
+        return self._user_id
+
+    @property
+    def data_type(self):
+        return self._endpoint.data_type
+
+    async def create_transaction(self, counter=None):
+        return await self._accesslink.create_transaction(
+            self._endpoint, self._user_id, self._access_token, counter)
+
+    async def list_updates(self, transaction):
+        result = await transaction.list_items()
+
+        if result is None:
+            return None
+
+        return result.get(self._endpoint.result_name)
+
+    async def get_update(self, transaction, url):
+        return await transaction.get_item(
+            url, cache=CACHE_IMMUTABLE if self._endpoint.cacheable else None)
+
+    async def get_updates(self, transaction, urls):
+        """Fetch all items of a transaction concurrently, preserving order."""
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                _LOGGER.debug('Reading update for URL: %s', url)
+                return await self.get_update(transaction, url)
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # A failed transaction is fetched again in full, so fetches still
+            # queued or in flight would only spend rate-limit tokens.
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @property
+    def event_type(self):
+        return self._endpoint.event_type
+
+    def get_timestamp(self, data):
+        return data[self._endpoint.timestamp_name]
+
+    def parse_timestamp(self, data):
+        value = data.get(self._endpoint.timestamp_name)
+        parsed = parse_timestamp(value) if value else None
+
+        if parsed is not None and parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+
+        return parsed
+
+    def ordered(self, items):
+        """Yield items oldest first, parsing each timestamp only once."""
+        keyed = sorted(
+            (self.parse_timestamp(data) or MIN_TIMESTAMP, index)
+            for index, data in enumerate(items))
+
+        for _, index in keyed:
+            yield items[index]
+
+
+class PolarCoordinator:
+    """Schedules AccessLink pulls for all endpoints of one config entry."""
+
+    def __init__(self, hass, accesslink, store, user_id, access_token, endpoint_names,
+                 concurrency=DEFAULT_FETCH_CONCURRENCY, scan_interval=SCAN_INTERVAL, offset=0):
+        self.hass = hass
+        self.offset = offset
+        self.accesslink = accesslink
+        self.store = store
+        self.user_id = user_id
+        self.scan_interval = scan_interval
+        self.endpoints = {
+            name: PolarEndpoint(accesslink, ENDPOINTS[name], user_id, access_token, concurrency)
+            for name in endpoint_names}
+        self.options = {}
+        self.setup_duration = None
+        self.statistics = None
+        self.samples = None
+        self.activity_samples = None
+        self.last_refresh = dict.fromkeys(self.endpoints)
+        self.metrics = PolarMetrics(self.endpoints)
+        self.schedule = None
+        self._schedule_store = None
+        self._listeners = {name: [] for name in self.endpoints}
+        self._in_flight = {}
+        self._running = False
+        self._start_timer = None
+        self._poll_timer = None
+        self._unsubscribe = []
+
+    async def async_enable_adaptive_polling(self, min_interval, max_interval):
+        """Poll on a schedule learned from when this user's data arrives."""
+        self._schedule_store = Store(
+            self.hass, SCHEDULE_STORAGE_VERSION, SCHEDULE_STORAGE_KEY.format(self.user_id))
+
+        self.schedule = SyncSchedule.from_dict(
+            await self._schedule_store.async_load(),
+            self.scan_interval.total_seconds(),
+            min_interval.total_seconds(),
+            max_interval.total_seconds())
+
+    @callback
+    def async_start(self):
+        """Start the shared polling schedule and webhook subscriptions.
+
+        The first pull waits until Home Assistant has started, so setup never
+        blocks on the network.
+        """
+        self._running = True
+
+        @callback
+        def start_polling(now):
+            self._start_timer = None
+
+            if self.schedule is not None:
+                self.hass.async_create_task(self._async_adaptive_refresh())
+                return
+
+            self.hass.async_create_task(self._async_scheduled_refresh())
+            self._unsubscribe.append(
+                async_track_time_interval(self.hass, self._async_scheduled_refresh, self.scan_interval))
+
+        @callback
+        def schedule_polling(event=None):
+            self._start_timer = async_call_later(self.hass, self.offset, start_polling)
+
+        if self.hass.state == CoreState.running:
+            schedule_polling()
+        else:
+            self._start_timer = self.hass.bus.async_listen_once(
+                EVENT_HOMEASSISTANT_STARTED, schedule_polling)
+
+        for name in self.endpoints:
+            self._unsubscribe.append(
+                async_dispatcher_connect(
+                    self.hass,
+                    SIGNAL_WEBHOOK_UPDATE.format(self.user_id, name),
+                    self._webhook_callback(name)))
+
+        if self.statistics is not None:
+            self._unsubscribe.extend(self.statistics.async_attach(self))
+
+        if self.activity_samples is not None:
+            self._unsubscribe.extend(self.activity_samples.async_attach(self))
+
+        if self.schedule is not None and self.schedule.day is None:
+            task = self.hass.async_create_task(self._async_learn_schedule())
+            self._unsubscribe.append(task.cancel)
+
+    @callback
+    def async_stop(self):
+        self._running = False
+
+        if self._start_timer is not None:
+            self._start_timer()
+            self._start_timer = None
+
+        if self._poll_timer is not None:
+            self._poll_timer()
+            self._poll_timer = None
+
+        while self._unsubscribe:
+            self._unsubscribe.pop()()
+
+        for task in self._in_flight.values():
+            task.cancel()
+
+    @callback
+    def async_on_stop(self, unsubscribe):
+        """Call unsubscribe when the coordinator stops."""
+        self._unsubscribe.append(unsubscribe)
+
+    @callback
+    def async_add_listener(self, endpoint_name, listener):
+        """Register a coroutine called with each new item, oldest first."""
+        listeners = self._listeners[endpoint_name]
+        listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            listeners.remove(listener)
+
+        return remove_listener
+
+    def _webhook_callback(self, endpoint_name):
+        async def refresh():
+            _LOGGER.debug('Webhook triggered update for endpoint %s', endpoint_name)
+            await self.async_refresh([endpoint_name])
+
+        return refresh
+
+    async def _async_adaptive_refresh(self, now=None):
+        self._poll_timer = None
+
+        try:
+            await self._async_scheduled_refresh()
+        finally:
+            if self._running:
+                delay = self.schedule.next_delay(dt_util.now())
+                _LOGGER.debug('Next poll for user %s in %.0f minutes', self.user_id, delay / 60)
+                self._poll_timer = async_call_later(self.hass, delay, self._async_adaptive_refresh)
+
+    async def _async_learn_schedule(self):
+        """Seed a new polling schedule from the records already stored."""
+        await self.store.async_wait_loaded()
+
+        for name, endpoint in self.endpoints.items():
+            async for record in self.store.async_iter(name):
+                self._async_observe(endpoint, record['data'])
+
+        _LOGGER.debug('Learned polling schedule for user %s: %s', self.user_id, self.schedule.weights)
+
+    @callback
+    def _async_observe(self, endpoint, data):
+        """Teach the polling schedule when an item became available."""
+        moment = endpoint.parse_timestamp(data)
+
+        if moment is None:
+            return
+
+        if endpoint.name == CONF_TRAINING_DATA and data.get('duration'):
+            # An exercise can only be synced once it has ended.
+            try:
+                moment += parse_duration(data['duration'])
+            except ValueError:
+                pass
+
+        self.schedule.observe(dt_util.as_local(moment), dt_util.now().date().toordinal())
+        self._schedule_store.async_delay_save(self.schedule.as_dict, SCHEDULE_SAVE_DELAY)
+
+    async def _async_scheduled_refresh(self, now=None):
+        endpoint_names = await self.async_available_endpoints()
+
+        if not endpoint_names:
+            _LOGGER.debug('No data available for user %s', self.user_id)
+            return
+
+        await self.async_refresh(endpoint_names)
+
+    async def async_available_endpoints(self):
+        """Return the endpoints the pull notifications report new data for."""
+        try:
+            available = await self.accesslink.list_available_data_shared(STAGGER_WINDOW)
+        except (PolarApiError, *TRANSPORT_ERRORS) as err:
+            # Pulling every endpoint records any persisting failure in the metrics.
+            _LOGGER.warning('Unable to check available Polar data, pulling all endpoints: %r', err)
+            return list(self.endpoints)
+
+        data_types = {
+            item.get('data-type') for item in available
+            if str(item.get('user-id')) == str(self.user_id)}
+
+        return [
+            name for name, endpoint in self.endpoints.items()
+            if endpoint.data_type in data_types]
+
+    async def async_refresh(self, endpoint_names=None):
+        """Pull the given endpoints, joining any pull already in flight."""
+        if endpoint_names is None:
+            endpoint_names = list(self.endpoints)
+
+        tasks = []
+
+        for name in endpoint_names:
+            task = self._in_flight.get(name)
+
+            if task is None:
+                task = self.hass.async_create_task(self._async_refresh_endpoint(name))
+                self._in_flight[name] = task
+                task.add_done_callback(
+                    lambda _, name=name: self._in_flight.pop(name, None))
+            else:
+                _LOGGER.debug('Update already in progress for endpoint %s', name)
+
+            tasks.append(task)
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _async_process_items(self, endpoint, items):
+        listeners = list(self._listeners[endpoint.name])
+
+        for data in endpoint.ordered(items):
+            if self.schedule is not None:
+                self._async_observe(endpoint, data)
+
+            self.hass.bus.async_fire(
+                endpoint.event_type, {'user_id': self.user_id, **data})
+
+            for listener in listeners:
+                await listener(data)
+
+    async def _async_ingest_samples(self, transaction, urls, items):
+        """Stream exercise samples while the transaction is still open."""
+        physical = self.store.latest(CONF_PHYSICAL_INFO) or {}
+        max_heart_rate = physical.get('maximum-heart-rate')
+
+        for url, exercise in zip(urls, items):
+            if exercise.get('id') is None or await self.samples.async_has(exercise['id']):
+                continue
+
+            _LOGGER.debug('Ingesting samples for exercise %s', exercise['id'])
+
+            try:
+                await self.samples.async_ingest(transaction, url, exercise, max_heart_rate)
+            except Exception:
+                # One bad exercise must not keep the transaction open forever.
+                _LOGGER.exception('Error ingesting samples for exercise %s', exercise['id'])
+
+    async def _async_ingest_activity_samples(self, transaction, urls, items):
+        """Fetch intraday samples of each activity day in the transaction."""
+        for url, activity in zip(urls, items):
+            _LOGGER.debug('Ingesting activity samples for %s', activity.get('date'))
+
+            try:
+                await self.activity_samples.async_ingest(transaction, url, activity)
+            except Exception:
+                _LOGGER.exception('Error ingesting activity samples for %s', activity.get('date'))
+
+    async def _async_refresh_endpoint(self, name):
+        endpoint = self.endpoints[name]
+
+        await self.store.async_wait_loaded()
+
+        _LOGGER.debug('Beginning update for endpoint: %s', name)
+        started = time.monotonic()
+        updates = None
+        # Time spent in AccessLink requests, from sending to the full response.
+        counter = RequestCounter()
+
+        try:
+            transaction = await endpoint.create_transaction(counter)
+
+            if transaction is None:
+                _LOGGER.debug('No updates available for endpoint %s', name)
+                self.last_refresh[name] = dt_util.utcnow()
+                self.metrics.async_record_update(name, time.monotonic() - started, counter.seconds)
+                return
+
+            await self.store.async_journal(name, transaction.url, JOURNAL_OPENED)
+            updates = await endpoint.list_updates(transaction)
+            listed = time.monotonic()
+            fetched = listed
+
+            if updates is not None:
+                _LOGGER.debug('Found %d updates for endpoint %s', len(updates), name)
+
+                # Items already stored, by a run that crashed before
+                # committing or under another transaction that listed them,
+                # are read back from disk instead of being fetched again.
+                stored = [url for url in updates if url in self.store]
+                missing = [url for url in updates if url not in self.store]
+
+                fetched_items = await endpoint.get_updates(transaction, missing)
+                fetched = time.monotonic()
+
+                await self.store.async_append(name, [
+                    (url, endpoint.get_timestamp(data), data)
+                    for url, data in zip(missing, fetched_items)])
+                await self.store.async_journal(name, transaction.url, JOURNAL_STORED)
+
+                items = fetched_items
+                urls = missing
+
+                if stored:
+                    _LOGGER.debug('Loaded %d previously stored items for endpoint %s', len(stored), name)
+                    items = await self.store.async_get(stored) + items
+                    urls = stored + urls
+
+                if self.samples is not None and name == CONF_TRAINING_DATA:
+                    await self._async_ingest_samples(transaction, urls, items)
+
+                if self.activity_samples is not None and name == CONF_DAILY_ACTIVITY:
+                    await self._async_ingest_activity_samples(transaction, urls, items)
+
+                await self._async_process_items(endpoint, items)
+
+            committing = time.monotonic()
+            await transaction.commit()
+            commit = time.monotonic() - committing
+            await self.store.async_journal(name, transaction.url, JOURNAL_COMMITTED)
+        except Exception as err:
+            self.metrics.async_record_error(name, err)
+            _LOGGER.exception('Error updating Polar endpoint %s', name)
+            raise
+
+        self.last_refresh[name] = dt_util.utcnow()
+        duration = time.monotonic() - started
+
+        self.metrics.async_record_update(
+            name, duration, counter.seconds, len(updates or []), counter.bytes, commit)
+
+        _LOGGER.debug(
+            'Finished update for endpoint %s: %d items in %d requests, list %.3fs, fetch %.3fs, '
+            'commit %.3fs, network %.3fs, total %.3fs',
+            name, len(updates or []), counter.requests, listed - started, fetched - listed, commit,
+            counter.seconds, duration)
+
+        if self.accesslink.scheduler is not None:
+            _LOGGER.debug('AccessLink rate limits: %s', self.accesslink.scheduler.stats)
+
+        if self.accesslink.cache is not None:
+            _LOGGER.debug('AccessLink response cache: %s', self.accesslink.cache.stats)
@@ -0,0 +1,40 @@
+"""Diagnostics download support for Polar."""
+from homeassistant.components.diagnostics import async_redact_data
+
+from .const import (
+    DATA_COORDINATORS, CONF_CLIENT_SECRET, CONF_ACCESS_TOKEN,
+    CONF_WEBHOOK_SECRET)
+
+TO_REDACT = {CONF_CLIENT_SECRET, CONF_ACCESS_TOKEN, CONF_WEBHOOK_SECRET}
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Return update metrics and client state for a config entry."""
+    data = {
+        'entry': async_redact_data(dict(entry.data), TO_REDACT),
+        'options': dict(entry.options)}
+
+    coordinator = hass.data.get(DATA_COORDINATORS, {}).get(entry.entry_id)
+
+    if coordinator is None:
+        return data
+
+    data['endpoints'] = {
+        name: {
+            'last_refresh': refreshed.isoformat() if refreshed else None,
+            **coordinator.metrics.endpoints[name].as_dict()}
+        for name, refreshed in coordinator.last_refresh.items()}
+    data['setup_seconds'] = coordinator.setup_duration
+    data['stored_records'] = len(coordinator.store)
+    data['pending_transactions'] = coordinator.store.pending_transactions()
+
+    if coordinator.schedule is not None:
+        data['poll_schedule'] = coordinator.schedule.as_dict()
+
+    if coordinator.accesslink.scheduler is not None:
+        data['rate_limits'] = coordinator.accesslink.scheduler.stats
+
+    if coordinator.accesslink.cache is not None:
+        data['response_cache'] = coordinator.accesslink.cache.stats
+
+    return data
@@ -0,0 +1,237 @@
+"""Export of stored Polar records to columnar files."""
+import csv
+import gzip
+import json
+import logging
+import os
+
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    EXPORT_DIRECTORY, EXPORT_STORAGE_KEY, EXPORT_STORAGE_VERSION, FORMAT_PARQUET,
+    FORMAT_ARROW, FORMAT_CSV)
+
+_LOGGER = logging.getLogger(__name__)
+
+EXTENSIONS = {FORMAT_PARQUET: 'parquet', FORMAT_ARROW: 'arrow', FORMAT_CSV: 'csv.gz'}
+
+EXPORT_CHUNK_SIZE = 1000
+
+# Column types, widened as values are seen: bool stays bool, int widens to
+# float, and anything else makes the column a string.
+TYPE_BOOL = 'bool'
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_STRING = 'string'
+
+RECORD_COLUMNS = ('key', 'timestamp')
+
+
+def _flatten(data, prefix=''):
+    """Yield (column, value) pairs, joining nested keys with '/' as RESOURCES do."""
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}/")
+        elif isinstance(value, list):
+            yield name, json.dumps(value, separators=(',', ':'))
+        else:
+            yield name, value
+
+
+def _flatten_record(record):
+    row = {name: record[name] for name in RECORD_COLUMNS}
+    row.update(_flatten(record['data']))
+    return row
+
+
+def _value_type(value):
+    if isinstance(value, bool):
+        return TYPE_BOOL
+
+    if isinstance(value, int):
+        return TYPE_INT
+
+    if isinstance(value, float):
+        return TYPE_FLOAT
+
+    return TYPE_STRING
+
+
+def _widen(current, value_type):
+    if current is None or current == value_type:
+        return value_type
+
+    if {current, value_type} == {TYPE_INT, TYPE_FLOAT}:
+        return TYPE_FLOAT
+
+    return TYPE_STRING
+
+
+def _convert(value, column_type):
+    if value is None:
+        return None
+
+    if column_type == TYPE_FLOAT:
+        return float(value)
+
+    if column_type == TYPE_STRING and not isinstance(value, str):
+        return json.dumps(value)
+
+    return value
+
+
+def available_format(requested=None):
+    """Return the requested format, or the best one the installed libraries allow."""
+    if requested == FORMAT_CSV:
+        return FORMAT_CSV
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if requested is not None:
+            _LOGGER.warning('pyarrow is not installed, exporting %s as compressed CSV', requested)
+
+        return FORMAT_CSV
+
+    return requested or FORMAT_PARQUET
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._output = gzip.open(path, 'wt', newline='')
+        self._writer = csv.DictWriter(self._output, list(columns), extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._output.close()
+
+
+class _ArrowWriter:
+    def __init__(self, path, columns, file_format):
+        import pyarrow as pa
+
+        types = {
+            TYPE_BOOL: pa.bool_(), TYPE_INT: pa.int64(),
+            TYPE_FLOAT: pa.float64(), TYPE_STRING: pa.string()}
+
+        self._pa = pa
+        self._schema = pa.schema([(name, types[column_type]) for name, column_type in columns.items()])
+
+        if file_format == FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._writer = pa.ipc.new_file(path, self._schema)
+
+    def write(self, rows):
+        table = self._pa.Table.from_pydict(
+            {name: [row.get(name) for row in rows] for name in self._schema.names},
+            schema=self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+class _EndpointExport:
+    """Buffers one endpoint's rows and writes them to its file in chunks."""
+
+    def __init__(self, path, columns, file_format):
+        self.path = path
+        self.columns = columns
+        self.file_format = file_format
+        self.count = 0
+        self._rows = []
+        self._writer = None
+
+    def add(self, record):
+        row = _flatten_record(record)
+        self._rows.append({
+            name: _convert(value, self.columns[name]) for name, value in row.items()})
+        return len(self._rows) >= EXPORT_CHUNK_SIZE
+
+    def flush(self):
+        """Write buffered rows; runs in the executor."""
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            if self.file_format == FORMAT_CSV:
+                self._writer = _CsvWriter(self.path, self.columns)
+            else:
+                self._writer = _ArrowWriter(self.path, self.columns, self.file_format)
+
+        rows, self._rows = self._rows, []
+        self._writer.write(rows)
+        self.count += len(rows)
+
+    def close(self):
+        if self._rows:
+            self.flush()
+
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def async_export(hass, coordinator, file_format=None, incremental=False):
+    """Export a coordinator's stored records, one file per endpoint.
+
+    Records are streamed from the store twice: once to find every column and
+    its type, then again to write them in chunks. The byte offset reached is
+    kept, so an incremental export writes only records stored since the last
+    export.
+    """
+    store = coordinator.store
+    await store.async_wait_loaded()
+
+    file_format = available_format(file_format)
+    marker_store = Store(
+        hass, EXPORT_STORAGE_VERSION, EXPORT_STORAGE_KEY.format(coordinator.user_id))
+    marker = await marker_store.async_load() or {}
+
+    end = await store.async_size()
+    start = marker.get('offset', 0) if incremental else 0
+
+    if start > end:
+        # The records file was truncated since the last export.
+        start = 0
+
+    schemas = {}
+
+    async for record in store.async_iter(start=start, end=end):
+        columns = schemas.setdefault(record['endpoint'], dict.fromkeys(RECORD_COLUMNS, TYPE_STRING))
+
+        for name, value in _flatten(record['data']):
+            columns[name] = columns.get(name) if value is None else _widen(
+                columns.get(name), _value_type(value))
+
+    stamp = dt_util.utcnow().strftime('%Y%m%d%H%M%S')
+    exports = {
+        endpoint_name: _EndpointExport(
+            hass.config.path(
+                EXPORT_DIRECTORY, str(coordinator.user_id),
+                f"{endpoint_name}_{stamp}.{EXTENSIONS[file_format]}"),
+            {name: column_type or TYPE_STRING for name, column_type in columns.items()},
+            file_format)
+        for endpoint_name, columns in schemas.items()}
+
+    try:
+        async for record in store.async_iter(start=start, end=end):
+            export = exports[record['endpoint']]
+
+            if export.add(record):
+                await hass.async_add_executor_job(export.flush)
+    finally:
+        for export in exports.values():
+            await hass.async_add_executor_job(export.close)
+
+    await marker_store.async_save({'offset': end})
+
+    for endpoint_name, export in exports.items():
+        _LOGGER.info('Exported %d %s records to %s', export.count, endpoint_name, export.path)
+
@@ -0,0 +1,64 @@
+"""Compiled extraction of sensor values from AccessLink payloads."""
+import functools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ResourceExtractor:
+    """Parses a raw endpoint payload into all configured sensor values at once.
+
+    Resource paths are split and unit parsers bound to the unit system once,
+    when the extractor is compiled. Resources reading the same field with the
+    same unit share a single parse of that field, and top-level fields, which
+    are most of them, skip the nested lookup.
+    """
+
+    def __init__(self, resources, system):
+        fields = {}
+
+        for resource in resources:
+            path = tuple(resource.name.split('/'))
+            parsers = fields.setdefault(path, {})
+            parsers.setdefault(id(resource.units), (resource.units.parser(system), []))[1].append(resource.name)
+
+        self._fields = []
+        self._nested = []
+
+        for path, parsers in fields.items():
+            for parse, names in parsers.values():
+                if len(path) == 1:
+                    self._fields.append((path[0], parse, tuple(names)))
+                else:
+                    self._nested.append((path[0], path[1:], parse, tuple(names)))
+
+    def extract(self, raw):
+        """Return a dict of resource name to parsed value for a payload."""
+        values = {}
+        get = raw.get
+
+        for key, parse, names in self._fields:
+            item = get(key)
+            value = parse(item) if item is not None else None
+
+            for name in names:
+                values[name] = value
+
+        for key, subpath, parse, names in self._nested:
+            item = get(key)
+
+            for subkey in subpath:
+                item = item.get(subkey) if isinstance(item, dict) else None
+
+            value = parse(item) if item is not None else None
+
+            for name in names:
+                values[name] = value
+
+        return values
+
+
+@functools.lru_cache(maxsize=None)
+def shared_extractor(resources, system):
+    """Return the extractor for a tuple of resources, shared by every entry."""
+    return ResourceExtractor(resources, system)
@@ -0,0 +1,55 @@
+"""Helpers shared by the Polar platforms."""
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from .const import (
+    DOMAIN, CONF_UNIT_SYSTEM, CONF_MONITORED_RESOURCES, SYSTEM_METRIC,
+    SYSTEM_IMPERIAL, DATA_SESSION, CONF_CASSETTE_MODE, CONF_CASSETTE_PATH,
+    CONF_REPLAY_SPEED, DEFAULT_CASSETTE_PATH, DEFAULT_REPLAY_SPEED,
+    CASSETTE_MODE_RECORD)
+
+
+def entry_options(hass, entry):
+    """Return the configuration for an entry, with its options overriding YAML."""
+    config = dict(hass.data.get(DOMAIN) or {})
+    config.update(entry.options)
+
+    if not config.get(CONF_UNIT_SYSTEM):
+        config[CONF_UNIT_SYSTEM] = SYSTEM_METRIC if hass.config.units.is_metric else SYSTEM_IMPERIAL
+    elif not isinstance(config[CONF_UNIT_SYSTEM], str):
+        # YAML configuration is validated into a UnitSystem object.
+        config[CONF_UNIT_SYSTEM] = SYSTEM_METRIC if config[CONF_UNIT_SYSTEM].is_metric else SYSTEM_IMPERIAL
+
+    config[CONF_MONITORED_RESOURCES] = config.get(CONF_MONITORED_RESOURCES) or {}
+
+    return config
+
+
+def client_session(hass):
+    """Return the HTTP session AccessLink clients should use."""
+    return hass.data.get(DATA_SESSION) or async_get_clientsession(hass)
+
+
+async def async_setup_cassette(hass, config):
+    """Record AccessLink traffic to, or replay it from, a cassette if configured."""
+    mode = config.get(CONF_CASSETTE_MODE)
+
+    if mode is None:
+        return
+
+    from .cassette import RecordingSession, ReplaySession
+
+    path = hass.config.path(config.get(CONF_CASSETTE_PATH, DEFAULT_CASSETTE_PATH))
+
+    if mode == CASSETTE_MODE_RECORD:
+        session = RecordingSession(async_get_clientsession(hass), path)
+    else:
+        session = await hass.async_add_executor_job(
+            ReplaySession.from_file, path, config.get(CONF_REPLAY_SPEED, DEFAULT_REPLAY_SPEED))
+
+    hass.data[DATA_SESSION] = session
+
+    async def async_close(event):
+        await hass.async_add_executor_job(session.close)
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close)
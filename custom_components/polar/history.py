@@ -0,0 +1,230 @@
+"""Backfill of stored Polar records into long-term statistics."""
+import array
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import tempfile
+
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DOMAIN, CONF_TRAINING_DATA, CONF_DAILY_ACTIVITY, CONF_PHYSICAL_INFO,
+    UNIT_MINUTES, parse_duration, parse_timestamp)
+
+_LOGGER = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+
+# Values per metric held in memory before a sorted run is spilled to disk,
+# and values read back from each run at a time while merging.
+RUN_SIZE = 10000
+RUN_READ_SIZE = 1000
+
+
+def _duration_minutes(raw):
+    return parse_duration(raw).total_seconds() / 60
+
+
+# Every item adds to the running sum.
+KIND_SUM = 'sum'
+# Whole-day summaries that are resent as the day goes on; the last one wins.
+KIND_DAILY = 'daily'
+# Point measurements stored as hourly mean/min/max.
+KIND_MEAN = 'mean'
+
+# (endpoint, timestamp field, value field, statistic key, name, unit, kind, convert)
+HISTORY_METRICS = [
+    (CONF_TRAINING_DATA, 'start-time', 'calories', 'exercise_calories', 'Exercise Calories', 'kcal', KIND_SUM, None),
+    (CONF_TRAINING_DATA, 'start-time', 'distance', 'exercise_distance', 'Exercise Distance', 'm', KIND_SUM, None),
+    (CONF_TRAINING_DATA, 'start-time', 'duration', 'exercise_duration', 'Exercise Duration', UNIT_MINUTES, KIND_SUM, _duration_minutes),
+    (CONF_TRAINING_DATA, 'start-time', 'training-load', 'training_load', 'Training Load', None, KIND_SUM, None),
+    (CONF_DAILY_ACTIVITY, 'date', 'calories', 'daily_calories', 'Daily Calories', 'kcal', KIND_DAILY, None),
+    (CONF_DAILY_ACTIVITY, 'date', 'active-steps', 'daily_active_steps', 'Daily Active Steps', 'steps', KIND_DAILY, None),
+    (CONF_PHYSICAL_INFO, 'created', 'weight', 'weight', 'Weight', 'kg', KIND_MEAN, None),
+    (CONF_PHYSICAL_INFO, 'created', 'resting-heart-rate', 'resting_heart_rate', 'Resting Heart Rate', 'bpm', KIND_MEAN, None)]
+
+
+def _hour_start(endpoint_name, raw):
+    if endpoint_name == CONF_DAILY_ACTIVITY:
+        value = dt_util.start_of_local_day(datetime.date.fromisoformat(raw))
+    else:
+        value = parse_timestamp(raw)
+
+        if value is None:
+            return None
+
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+
+    return dt_util.as_utc(value).replace(minute=0, second=0, microsecond=0)
+
+
+class _SortedRuns:
+    """(hour, sequence, value) triples of one metric, sorted in bounded memory.
+
+    Up to RUN_SIZE triples are buffered; each full buffer is sorted and
+    spilled to a temporary file as a run. Iterating merges the runs back,
+    reading each a chunk at a time, so memory does not grow with history.
+    The sequence number keeps records within an hour in stored order.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._buffer = []
+        self._runs = []
+        self._file = None
+
+    def add(self, hour, value):
+        """Buffer a value, returning whether the buffer should be spilled."""
+        self._buffer.append((hour, self.count, value))
+        self.count += 1
+        return len(self._buffer) >= RUN_SIZE
+
+    def spill(self):
+        """Write the buffer out as one sorted run; runs in the executor."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+
+        self._buffer.sort()
+        self._file.seek(0, os.SEEK_END)
+        self._runs.append((self._file.tell(), len(self._buffer)))
+        array.array('d', itertools.chain.from_iterable(self._buffer)).tofile(self._file)
+        self._buffer = []
+
+    def _read_run(self, offset, count):
+        while count:
+            size = min(count, RUN_READ_SIZE)
+            chunk = array.array('d')
+            self._file.seek(offset)
+            chunk.fromfile(self._file, size * 3)
+            offset += chunk.itemsize * len(chunk)
+            count -= size
+
+            for index in range(0, len(chunk), 3):
+                yield chunk[index], chunk[index + 1], chunk[index + 2]
+
+    def __iter__(self):
+        self._buffer.sort()
+        runs = [self._read_run(offset, count) for offset, count in self._runs]
+        return heapq.merge(*runs, self._buffer)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def _async_collect(hass, store, endpoint_name, metrics, collected):
+    """Stream one endpoint's records into sorted (hour, value) runs per metric."""
+    async for record in store.async_iter(endpoint_name, IMPORT_BATCH_SIZE):
+        data = record['data']
+
+        for (timestamp_field, path, convert), runs in zip(metrics, collected):
+            raw = data.get(timestamp_field)
+            value = data.get(path)
+
+            if raw is None or value is None:
+                continue
+
+            start = _hour_start(endpoint_name, raw)
+
+            if start is None:
+                continue
+
+            if runs.add(start.timestamp(), convert(value) if convert else value):
+                await hass.async_add_executor_job(runs.spill)
+
+
+def _iter_statistics(triples, kind):
+    """Yield hourly statistics rows from time-ordered triples, one bucket at a time."""
+    total = 0.0
+    current = None
+    bucket = []
+
+    def row():
+        nonlocal total
+        start = dt_util.utc_from_timestamp(current)
+
+        if kind == KIND_MEAN:
+            return {
+                'start': start, 'mean': sum(bucket) / len(bucket),
+                'min': min(bucket), 'max': max(bucket), 'state': bucket[-1]}
+
+        state = bucket[-1] if kind == KIND_DAILY else sum(bucket)
+        total += state
+        return {'start': start, 'state': state, 'sum': total}
+
+    for hour, _, value in triples:
+        if current is not None and hour != current:
+            yield row()
+            bucket = []
+
+        current = hour
+        bucket.append(value)
+
+    if current is not None:
+        yield row()
+
+
+def _next_batch(rows):
+    return list(itertools.islice(rows, IMPORT_BATCH_SIZE))
+
+
+async def async_import_history(hass, coordinator):
+    """Write all stored records for a coordinator as external statistics."""
+    store = coordinator.store
+    await store.async_wait_loaded()
+    endpoints = {}
+
+    for metric in HISTORY_METRICS:
+        endpoints.setdefault(metric[0], []).append(metric)
+
+    for endpoint_name, metrics in endpoints.items():
+        collected = [_SortedRuns() for _ in metrics]
+
+        try:
+            await _async_collect(
+                hass, store, endpoint_name,
+                [(timestamp_field, path, convert) for _, timestamp_field, path, *_, convert in metrics],
+                collected)
+
+            for metric, runs in zip(metrics, collected):
+                await _async_import_metric(hass, coordinator, metric, runs)
+        finally:
+            for runs in collected:
+                await hass.async_add_executor_job(runs.close)
+
+
+async def _async_import_metric(hass, coordinator, metric, runs):
+    from homeassistant.components.recorder.statistics import async_add_external_statistics
+
+    _, _, _, key, name, unit, kind, _ = metric
+
+    if not runs.count:
+        return
+
+    metadata = {
+        'has_mean': kind == KIND_MEAN,
+        'has_sum': kind != KIND_MEAN,
+        'name': f"Polar {name}",
+        'source': DOMAIN,
+        'statistic_id': f"{DOMAIN}:{key}_{coordinator.user_id}",
+        'unit_of_measurement': unit}
+
+    # Runs are read back from disk, so rows are built in the executor and
+    # handed to the recorder a batch at a time.
+    rows = _iter_statistics(runs, kind)
+    count = 0
+
+    while True:
+        batch = await hass.async_add_executor_job(_next_batch, rows)
+
+        if not batch:
+            break
+
+        async_add_external_statistics(hass, metadata, batch)
+        count += len(batch)
+
+    _LOGGER.info('Imported %d hourly statistics for %s', count, metadata['statistic_id'])
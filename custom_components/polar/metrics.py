@@ -0,0 +1,117 @@
+"""Runtime instrumentation of the Polar update pipeline."""
+import logging
+
+from homeassistant.core import callback
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DIAG_DURATION, DIAG_NETWORK_TIME, DIAG_PROCESSING_TIME, DIAG_ITEMS,
+    DIAG_BYTES, DIAG_COMMIT_LATENCY, DIAG_ERRORS, DIAG_DATA_AGE)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EndpointMetrics:
+    """Figures from the most recent update of one endpoint."""
+
+    def __init__(self):
+        self.values = dict.fromkeys((
+            DIAG_DURATION, DIAG_NETWORK_TIME, DIAG_PROCESSING_TIME, DIAG_ITEMS,
+            DIAG_BYTES, DIAG_COMMIT_LATENCY))
+        self.errors = 0
+        self.updates = 0
+        self.last_data = None
+        self.last_error = None
+
+    def value(self, name):
+        if name == DIAG_ERRORS:
+            return self.errors
+
+        if name == DIAG_DATA_AGE:
+            if self.last_data is None:
+                return None
+
+            return round((dt_util.utcnow() - self.last_data).total_seconds() / 60)
+
+        return self.values[name]
+
+    def as_dict(self):
+        return {
+            **self.values,
+            DIAG_ERRORS: self.errors,
+            'updates': self.updates,
+            'last_data': self.last_data.isoformat() if self.last_data else None,
+            'last_error': self.last_error}
+
+
+class PolarMetrics:
+    """Per-endpoint update metrics for one coordinator."""
+
+    def __init__(self, endpoint_names):
+        self.endpoints = {name: EndpointMetrics() for name in endpoint_names}
+        self._listeners = []
+
+    @callback
+    def async_add_listener(self, listener):
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def async_record_update(self, endpoint_name, duration, network, items=0, size=0, commit=None):
+        """Record a finished update; network covers the transaction's requests, commit included."""
+        metrics = self.endpoints[endpoint_name]
+        metrics.updates += 1
+        metrics.values.update({
+            DIAG_DURATION: round(duration, 3),
+            DIAG_NETWORK_TIME: round(network, 3),
+            DIAG_PROCESSING_TIME: round(max(0.0, duration - network), 3),
+            DIAG_ITEMS: items,
+            DIAG_BYTES: size,
+            DIAG_COMMIT_LATENCY: round(commit, 3) if commit is not None else None})
+
+        if items:
+            metrics.last_data = dt_util.utcnow()
+
+        self._async_changed()
+
+    @callback
+    def async_record_error(self, endpoint_name, err):
+        metrics = self.endpoints[endpoint_name]
+        metrics.errors += 1
+        metrics.last_error = f"{dt_util.utcnow().isoformat()}: {err!r}"
+
+        self._async_changed()
+
+    @callback
+    def _async_changed(self):
+        for listener in list(self._listeners):
+            listener()
+
+    def as_dict(self):
+        return {name: metrics.as_dict() for name, metrics in self.endpoints.items()}
+
+
+async def async_profile_refresh(hass, coordinator, path):
+    """Refresh all endpoints of a coordinator under cProfile and dump the stats.
+
+    The profiler covers the event loop thread for the duration of the update,
+    so unrelated Home Assistant work running at the same time shows up too.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    try:
+        await coordinator.async_refresh()
+    finally:
+        profiler.disable()
+
+    await hass.async_add_executor_job(profiler.dump_stats, path)
+    _LOGGER.info('Wrote profile of Polar update for user %s to %s', coordinator.user_id, path)
+
@@ -0,0 +1,102 @@
+"""Adaptive polling schedule learned from when a user's data arrives."""
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+HOURS = 24
+
+# Weight of an observation halves roughly every two weeks.
+DAILY_DECAY = 0.95
+
+# Observations needed before the schedule deviates from the base interval.
+MIN_WEIGHT = 3.0
+
+# Share of an observation given to each neighbouring hour, so that syncs
+# drifting across an hour boundary still form one window.
+NEIGHBOUR_WEIGHT = 0.5
+
+
+class SyncSchedule:
+    """Time-of-day histogram of data arrivals, used to pick the next poll delay.
+
+    Each hour of the day carries an exponentially decayed weight of the data
+    that arrived in it. The delay until the next poll is the base interval
+    divided by the square root of how much likelier the current hour is than
+    a uniform one, clamped to the bounds, and never runs past the start of a
+    likely hour.
+    """
+
+    def __init__(self, base_interval, min_interval, max_interval):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.weights = [0.0] * HOURS
+        self.day = None
+
+    def _decay(self, today):
+        if self.day is None:
+            self.day = today
+            return
+
+        if today > self.day:
+            factor = DAILY_DECAY ** (today - self.day)
+            self.weights = [weight * factor for weight in self.weights]
+            self.day = today
+
+    def observe(self, moment, today):
+        """Record data that became available at a local datetime."""
+        self._decay(today)
+        weight = DAILY_DECAY ** max(0, today - moment.date().toordinal())
+        hour = moment.hour
+
+        self.weights[hour] += weight
+        self.weights[(hour - 1) % HOURS] += weight * NEIGHBOUR_WEIGHT
+        self.weights[(hour + 1) % HOURS] += weight * NEIGHBOUR_WEIGHT
+
+    def likelihood(self, hour):
+        """How much likelier data is in an hour than under a uniform spread."""
+        total = sum(self.weights)
+        return self.weights[hour] * HOURS / total if total else 0.0
+
+    def next_delay(self, now):
+        """Seconds until the next poll for a local datetime."""
+        if sum(self.weights) < MIN_WEIGHT * (1 + 2 * NEIGHBOUR_WEIGHT):
+            return self.base_interval
+
+        likelihood = self.likelihood(now.hour)
+
+        if likelihood > 0:
+            delay = self.base_interval / likelihood ** 0.5
+        else:
+            delay = self.max_interval
+
+        delay = min(max(delay, self.min_interval), self.max_interval)
+
+        # Wake up at the start of the next likely hour rather than sleeping through it.
+        into_hour = now.minute * 60 + now.second
+        until = 3600 - into_hour
+
+        for offset in range(1, HOURS):
+            if until >= delay:
+                break
+
+            if self.likelihood((now.hour + offset) % HOURS) >= 1:
+                delay = until
+                break
+
+            until += 3600
+
+        return max(delay, self.min_interval)
+
+    def as_dict(self):
+        return {'weights': self.weights, 'day': self.day}
+
+    @classmethod
+    def from_dict(cls, data, base_interval, min_interval, max_interval):
+        schedule = cls(base_interval, min_interval, max_interval)
+
+        if data and len(data.get('weights') or []) == HOURS:
+            schedule.weights = [float(weight) for weight in data['weights']]
+            schedule.day = data.get('day')
+
+        return schedule
@@ -0,0 +1,377 @@
+"""Streaming ingestion of exercise samples into memory-mapped arrays."""
+import array
+import json
+import logging
+import math
+import mmap
+import os
+import re
+
+from homeassistant.core import callback
+
+from .const import (
+    SAMPLE_HEART_RATE, SAMPLE_SPEED, SAMPLE_POWER, SAMPLE_HR_ZONES,
+    SAMPLE_MAX_POWER, SAMPLE_BEST_SPEED, SAMPLE_BEST_PACE, SYSTEM_IMPERIAL)
+
+_LOGGER = logging.getLogger(__name__)
+
+SAMPLE_SUFFIX = '.f32'
+ROUTE_SERIES = ('lat', 'lon', 'ele')
+ROUTE_SUFFIX = '.f64'
+SUMMARY_FILE = 'summary.json'
+LATEST_FILE = 'latest.json'
+
+FLUSH_SIZE = 16 * 1024
+BEST_WINDOW_SECONDS = 60
+ZONE_LOWER_BOUND = 0.5
+ZONE_COUNT = 5
+# Zones are 10% of HRmax wide, so the lower bound is this many zone widths.
+ZONE_OFFSET = int(ZONE_LOWER_BOUND * 2 * ZONE_COUNT)
+KM_PER_MILE = 1.609344
+
+DATA_KEY = re.compile(rb'"data"\s*:\s*"')
+
+
+class SampleStreamParser:
+    """Incremental parser for an AccessLink sample document.
+
+    The comma separated "data" string is converted to float32 values as the
+    bytes arrive and handed out in bounded chunks, while the small remainder
+    of the document is kept to read the sample type and recording rate.
+    """
+
+    def __init__(self):
+        self._meta = bytearray()
+        self._partial = b''
+        self._in_data = False
+        self._done_data = False
+        self.values = array.array('f')
+
+    def feed(self, chunk):
+        if not self._in_data:
+            if self._done_data:
+                self._meta += chunk
+                return
+
+            self._meta += chunk
+            match = DATA_KEY.search(self._meta)
+
+            if match is None:
+                return
+
+            chunk = bytes(self._meta[match.end():])
+            del self._meta[match.start():]
+            self._meta += b'"data":""'
+            self._in_data = True
+
+        end = chunk.find(b'"')
+
+        if end >= 0:
+            self._meta += chunk[end + 1:]
+            chunk = chunk[:end]
+            self._in_data = False
+            self._done_data = True
+
+        buffer = self._partial + chunk
+        tokens = buffer.split(b',') if buffer else []
+        self._partial = tokens.pop() if self._in_data and tokens else b''
+
+        self.values.extend(_to_float(token) for token in tokens)
+
+    def take(self):
+        """Return and clear the values parsed so far."""
+        values = self.values
+        self.values = array.array('f')
+        return values
+
+    def finish(self):
+        """Return the sample document without its data."""
+        return json.loads(bytes(self._meta))
+
+
+def _to_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        return math.nan
+
+
+class RouteStreamParser:
+    """Incremental parser for GPX routes, keeping only point coordinates."""
+
+    def __init__(self):
+        import xml.etree.ElementTree as ElementTree
+
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self._segment = None
+        self.values = {name: array.array('d') for name in ROUTE_SERIES}
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+        for event, element in self._parser.read_events():
+            tag = element.tag.rsplit('}', 1)[-1]
+
+            if event == 'start':
+                if tag == 'trkseg':
+                    self._segment = element
+                continue
+
+            if tag != 'trkpt':
+                continue
+
+            ele = next((child for child in element if child.tag.endswith('ele')), None)
+            self.values['lat'].append(float(element.get('lat')))
+            self.values['lon'].append(float(element.get('lon')))
+            self.values['ele'].append(float(ele.text) if ele is not None and ele.text else math.nan)
+
+            # Drop processed points so memory stays bounded on long routes.
+            if self._segment is not None:
+                self._segment.clear()
+
+    def take(self):
+        values = self.values
+        self.values = {name: array.array('d') for name in ROUTE_SERIES}
+        return values
+
+
+def open_series(path, typecode='f'):
+    """Memory-map a stored series, returning a (memoryview, close) pair."""
+    handle = open(path, 'rb')
+
+    if os.fstat(handle.fileno()).st_size == 0:
+        handle.close()
+        return memoryview(array.array(typecode)), lambda: None
+
+    mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped).cast(typecode)
+
+    def close():
+        view.release()
+        mapped.close()
+        handle.close()
+
+    return view, close
+
+
+def best_window_mean(values, rate, seconds=BEST_WINDOW_SECONDS):
+    """Highest mean over any window of the given length, in one pass."""
+    size = max(1, int(round(seconds / rate)))
+
+    if len(values) < size:
+        return None
+
+    window = 0.0
+    best = None
+
+    for index, value in enumerate(values):
+        window += 0.0 if math.isnan(value) else value
+
+        if index >= size:
+            previous = values[index - size]
+            window -= 0.0 if math.isnan(previous) else previous
+
+        if index >= size - 1 and (best is None or window > best):
+            best = window
+
+    return best / size
+
+
+def time_in_zones(values, rate, max_heart_rate):
+    """Seconds spent in each of the five %HRmax heart rate zones."""
+    seconds = [0.0] * ZONE_COUNT
+
+    for value in values:
+        if math.isnan(value):
+            continue
+
+        # Floored, as int() would put values just below the lowest zone into
+        # it. Multiplying before dividing keeps exact percentages exact.
+        zone = math.floor(value * 2 * ZONE_COUNT / max_heart_rate) - ZONE_OFFSET
+
+        if zone >= 0:
+            seconds[min(zone, ZONE_COUNT - 1)] += rate
+
+    return seconds
+
+
+def summary_value(summary, name, system):
+    """Return the sensor value for a SAMPLE_RESOURCES entry from a summary."""
+    if summary is None:
+        return None
+
+    if name.startswith(SAMPLE_HR_ZONES):
+        zones = summary.get(SAMPLE_HR_ZONES)
+        index = int(name[len(SAMPLE_HR_ZONES) + 1:]) - 1
+        return zones[index] / 60 if zones else None
+
+    if name == SAMPLE_BEST_PACE:
+        speed = summary.get(SAMPLE_BEST_SPEED)
+
+        if not speed:
+            return None
+
+        per_unit = KM_PER_MILE if system == SYSTEM_IMPERIAL else 1
+        return 60 / (speed / per_unit)
+
+    value = summary.get(name)
+    return round(value) if value is not None else None
+
+
+class ExerciseSampleStore:
+    """On-disk store of per-exercise sample series and derived summaries."""
+
+    def __init__(self, hass, path):
+        self.hass = hass
+        self.path = path
+        self.latest = None
+        self._listeners = []
+
+    async def async_load(self):
+        await self.hass.async_add_executor_job(lambda: os.makedirs(self.path, exist_ok=True))
+        self.latest = await self.hass.async_add_executor_job(self._read_json, LATEST_FILE)
+
+    def _read_json(self, *parts):
+        path = os.path.join(self.path, *parts)
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as source:
+            return json.load(source)
+
+    def _write_json(self, data, *parts):
+        path = os.path.join(self.path, *parts)
+        temporary = f"{path}.tmp"
+
+        with open(temporary, 'w') as output:
+            json.dump(data, output)
+
+        os.replace(temporary, path)
+
+    @callback
+    def async_add_listener(self, listener):
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def has(self, exercise_id):
+        return os.path.exists(os.path.join(self.path, str(exercise_id), SUMMARY_FILE))
+
+    async def async_has(self, exercise_id):
+        return await self.hass.async_add_executor_job(self.has, exercise_id)
+
+    def series_path(self, exercise_id, name, suffix=SAMPLE_SUFFIX):
+        return os.path.join(self.path, str(exercise_id), f"{name}{suffix}")
+
+    async def async_ingest(self, transaction, url, exercise, max_heart_rate=None):
+        """Stream the samples and route of an exercise to disk and summarise them."""
+        exercise_id = str(exercise['id'])
+        directory = os.path.join(self.path, exercise_id)
+        await self.hass.async_add_executor_job(lambda: os.makedirs(directory, exist_ok=True))
+
+        listing = await transaction.get_item(f"{url}/samples") or {}
+        rates = {}
+
+        for index, sample_url in enumerate(listing.get('samples', [])):
+            temporary = os.path.join(directory, f"{index}.tmp")
+            meta = await self._async_stream_samples(transaction, sample_url, temporary)
+            sample_type = str(meta.get('sample-type'))
+            rates[sample_type] = meta.get('recording-rate') or 1
+
+            await self.hass.async_add_executor_job(
+                os.replace, temporary, self.series_path(exercise_id, sample_type))
+
+        if exercise.get('has-route'):
+            await self._async_stream_route(transaction, url, exercise_id)
+
+        summary = await self.hass.async_add_executor_job(
+            self._summarise, exercise_id, rates,
+            max_heart_rate or (exercise.get('heart-rate') or {}).get('maximum'))
+        summary['id'] = exercise_id
+        summary['start-time'] = exercise.get('start-time')
+
+        await self.hass.async_add_executor_job(self._write_json, summary, exercise_id, SUMMARY_FILE)
+
+        if self.latest is None or (summary['start-time'] or '') >= (self.latest.get('start-time') or ''):
+            self.latest = summary
+            await self.hass.async_add_executor_job(self._write_json, summary, LATEST_FILE)
+
+            for listener in list(self._listeners):
+                listener()
+
+        return summary
+
+    async def _async_stream_samples(self, transaction, url, path):
+        parser = SampleStreamParser()
+        output = await self.hass.async_add_executor_job(open, path, 'wb')
+
+        async def consume(chunks):
+            async for chunk in chunks:
+                parser.feed(chunk)
+
+                if len(parser.values) >= FLUSH_SIZE:
+                    await self.hass.async_add_executor_job(parser.take().tofile, output)
+
+        try:
+            await transaction.stream_item(url, consume)
+            await self.hass.async_add_executor_job(parser.take().tofile, output)
+        finally:
+            await self.hass.async_add_executor_job(output.close)
+
+        return parser.finish()
+
+    async def _async_stream_route(self, transaction, url, exercise_id):
+        parser = RouteStreamParser()
+        outputs = {}
+
+        for name in ROUTE_SERIES:
+            outputs[name] = await self.hass.async_add_executor_job(
+                open, self.series_path(exercise_id, name, ROUTE_SUFFIX), 'wb')
+
+        def flush():
+            for name, values in parser.take().items():
+                values.tofile(outputs[name])
+
+        async def consume(chunks):
+            async for chunk in chunks:
+                parser.feed(chunk)
+
+                if len(parser.values['lat']) >= FLUSH_SIZE:
+                    await self.hass.async_add_executor_job(flush)
+
+        try:
+            await transaction.stream_item(f"{url}/gpx", consume, accept='application/gpx+xml')
+            await self.hass.async_add_executor_job(flush)
+        finally:
+            for output in outputs.values():
+                await self.hass.async_add_executor_job(output.close)
+
+    def _summarise(self, exercise_id, rates, max_heart_rate):
+        summary = {}
+
+        def with_series(sample_type, compute):
+            path = self.series_path(exercise_id, sample_type)
+
+            if sample_type not in rates or not os.path.exists(path):
+                return None
+
+            view, close = open_series(path)
+
+            try:
+                return compute(view, rates[sample_type])
+            finally:
+                close()
+
+        if max_heart_rate:
+            summary[SAMPLE_HR_ZONES] = with_series(
+                SAMPLE_HEART_RATE, lambda view, rate: time_in_zones(view, rate, max_heart_rate))
+
+        summary[SAMPLE_MAX_POWER] = with_series(SAMPLE_POWER, best_window_mean)
+        summary[SAMPLE_BEST_SPEED] = with_series(SAMPLE_SPEED, best_window_mean)
+
+        return summary
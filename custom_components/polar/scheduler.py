@@ -0,0 +1,159 @@
+"""Rate-limit-aware scheduling of AccessLink requests."""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_COMMIT = 0
+PRIORITY_LIST = 1
+PRIORITY_GET = 2
+
+HEADER_LIMIT = 'RateLimit-Limit'
+HEADER_USAGE = 'RateLimit-Usage'
+HEADER_RESET = 'RateLimit-Reset'
+HEADER_RETRY_AFTER = 'Retry-After'
+
+# AccessLink's documented minimum short-term quota: 500 requests per 15 minutes.
+DEFAULT_LIMIT = 500
+DEFAULT_PERIOD = 900
+
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+MAX_RETRIES = 4
+
+
+def _parse_pair(value):
+    """Parse an AccessLink rate-limit header of the form "short, long"."""
+    try:
+        return [int(part.strip()) for part in value.split(',')]
+    except (AttributeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Token bucket and priority queue shared by all entries of one client_id.
+
+    Commits are served before listings, and listings before item fetches, so
+    a transaction that has been read is closed before new work starts.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, period=DEFAULT_PERIOD):
+        self._capacity = limit
+        self._period = period
+        self._tokens = float(limit)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self.limits = None
+        self.usage = None
+        self.resets = None
+        self.requests = 0
+        self.throttled = 0
+
+    @property
+    def queue_depth(self):
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    @property
+    def stats(self):
+        self._refill()
+        return {
+            'limits': self.limits,
+            'usage': self.usage,
+            'resets': self.resets,
+            'tokens': round(self._tokens, 1),
+            'capacity': self._capacity,
+            'queue_depth': self.queue_depth,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'paused_for': max(0.0, round(self._paused_until - time.monotonic(), 1))}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (now - self._updated) * self._capacity / self._period)
+        self._updated = now
+
+    async def acquire(self, priority=PRIORITY_GET):
+        """Wait for a request slot at the given priority."""
+        self._refill()
+
+        if not self._waiters and self._tokens >= 1 and time.monotonic() >= self._paused_until:
+            self._tokens -= 1
+            self.requests += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._schedule()
+
+        await waiter
+
+    def _schedule(self):
+        if self._timer is not None:
+            return
+
+        self._refill()
+        delay = max(
+            self._paused_until - time.monotonic(),
+            (1 - self._tokens) * self._period / self._capacity,
+            0)
+
+        self._timer = asyncio.get_event_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+
+        if time.monotonic() >= self._paused_until:
+            while self._waiters and self._tokens >= 1:
+                _, _, waiter = heapq.heappop(self._waiters)
+
+                if waiter.done():
+                    continue
+
+                self._tokens -= 1
+                self.requests += 1
+                waiter.set_result(None)
+
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        if self._waiters:
+            self._schedule()
+
+    def update_from_headers(self, headers):
+        """Sync the bucket with the rate-limit headers of a response."""
+        limits = _parse_pair(headers.get(HEADER_LIMIT))
+        usage = _parse_pair(headers.get(HEADER_USAGE))
+        resets = _parse_pair(headers.get(HEADER_RESET))
+
+        if not limits or not usage:
+            return
+
+        self.limits, self.usage, self.resets = limits, usage, resets
+        self._refill()
+        self._capacity = max(1, limits[0])
+        # Other clients of the same credentials count against the same quota.
+        self._tokens = min(self._tokens, max(0, limits[0] - usage[0]))
+
+    def backoff(self, attempt, retry_after=None):
+        """Pause the whole bucket after a 429 response, with jitter."""
+        self.throttled += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE ** (attempt + 1))
+
+        if retry_after:
+            delay = max(delay, retry_after)
+
+        delay *= random.uniform(0.5, 1.5)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        _LOGGER.warning('AccessLink rate limit hit, pausing requests for %.0fs', delay)
+
+        return delay
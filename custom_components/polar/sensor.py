@@ -1,54 +1,104 @@
 """Support for HDHomeRun devices."""
 import logging
-import datetime
-
-from accesslink import AccessLink
+import time
 
+from homeassistant.core import callback
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.restore_state import RestoreEntity
 
+from .extract import shared_extractor
 from .const import (
-    DOMAIN, CONF_CLIENT_ID, CONF_CLIENT_SECRET, CONF_USER_ID,
-    CONF_ACCESS_TOKEN, CONF_MONITORED_RESOURCES, CONF_DAILY_ACTIVITY,
-    CONF_TRAINING_DATA, CONF_PHYSICAL_INFO, ENDPOINTS, RESOURCES_BY_NAME,
-    CONF_UNIT_SYSTEM, SYSTEM_METRIC, SYSTEM_IMPERIAL)
+    CONF_MONITORED_RESOURCES, RESOURCES_BY_NAME, DATA_COORDINATORS,
+    CONF_UNIT_SYSTEM, STATISTICS, SAMPLE_RESOURCES, ACTIVITY_SAMPLE_RESOURCES,
+    CONF_DIAGNOSTICS, DIAGNOSTICS, DIAG_DATA_AGE, DOMAIN, MANUFACTURER)
+from .helpers import entry_options
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = datetime.timedelta(minutes=30)
+try:
+    from homeassistant.helpers.entity import EntityCategory
+    ENTITY_CATEGORY_DIAGNOSTIC = EntityCategory.DIAGNOSTIC
+except ImportError:
+    ENTITY_CATEGORY_DIAGNOSTIC = 'diagnostic'
+
+try:
+    from homeassistant.components.sensor import SensorEntity
+except ImportError:
+    class SensorEntity(Entity):
+        """Fallback for Home Assistant versions without native sensor values."""
+
+        @property
+        def state(self):
+            return self.native_value
+
+        @property
+        def unit_of_measurement(self):
+            return self.native_unit_of_measurement
+
+try:
+    from homeassistant.components.sensor import RestoreSensor
+    HAS_RESTORE_SENSOR = True
+except ImportError:
+    HAS_RESTORE_SENSOR = False
+
+    class RestoreSensor(RestoreEntity, SensorEntity):
+        """Fallback for Home Assistant versions without restored native values."""
+
+def account_device_info(user_id):
+    """Device grouping every entity of one Polar account."""
+    return {
+        'identifiers': {(DOMAIN, str(user_id))},
+        'name': f"Polar {user_id}",
+        'manufacturer': MANUFACTURER,
+    }
 
 async def async_setup_entry(hass, entry, async_add_entities):
     """Set up Polar from a config entry."""
-    config = hass.data[DOMAIN]
-    resources_by_endpoint = config.get(CONF_MONITORED_RESOURCES)
-
-    accesslink = AccessLink(client_id=entry.data.get(CONF_CLIENT_ID),
-                        client_secret=entry.data.get(CONF_CLIENT_SECRET))
-
-    user_id = entry.data.get(CONF_USER_ID)
-    access_token = entry.data.get(CONF_ACCESS_TOKEN)
-
-    if CONF_UNIT_SYSTEM in config:
-        unit_system = config.get(CONF_UNIT_SYSTEM)
-    elif hass.config.units.is_metric:
-        unit_system = SYSTEM_METRIC
-    else:
-        unit_system = SYSTEM_IMPERIAL
+    started = time.monotonic()
+    config = entry_options(hass, entry)
+    resources_by_endpoint = config[CONF_MONITORED_RESOURCES]
+    unit_system = config[CONF_UNIT_SYSTEM]
+    coordinator = hass.data[DATA_COORDINATORS][entry.entry_id]
 
-    if resources_by_endpoint is not None:
+    if resources_by_endpoint:
         entities = []
 
         for endpoint_name, resources in resources_by_endpoint.items():
             _LOGGER.debug('Setting up Polar entities for endpoint: %s', endpoint_name)
 
-            endpoint = PolarEndpoint(accesslink, ENDPOINTS[endpoint_name], user_id, access_token)
-            add_resource_entities(entities, endpoint, resources, unit_system)
+            add_resource_entities(entities, coordinator, endpoint_name, resources, unit_system)
+
+        if coordinator.statistics is not None:
+            for endpoint_name in resources_by_endpoint:
+                for resource in STATISTICS.get(endpoint_name, []):
+                    entities.append(PolarStatisticSensor(
+                        coordinator.user_id, 'statistics', coordinator.statistics, resource, unit_system))
+
+        if coordinator.samples is not None:
+            for resource in SAMPLE_RESOURCES:
+                entities.append(PolarSampleSensor(
+                    coordinator.user_id, 'samples', coordinator.samples, resource, unit_system))
+
+        if coordinator.activity_samples is not None:
+            for resource in ACTIVITY_SAMPLE_RESOURCES:
+                entities.append(PolarStatisticSensor(
+                    coordinator.user_id, 'activity_samples', coordinator.activity_samples,
+                    resource, unit_system))
+
+        if config.get(CONF_DIAGNOSTICS):
+            for endpoint_name in resources_by_endpoint:
+                for resource in DIAGNOSTICS:
+                    entities.append(PolarDiagnosticSensor(
+                        coordinator.user_id, coordinator.metrics, endpoint_name, resource))
 
         async_add_entities(entities, update_before_add=False)
 
+        _LOGGER.debug('Created %d Polar entities in %.3fs', len(entities), time.monotonic() - started)
+
     return True
 
-def add_resource_entities(entities, endpoint, resources, system):
-    endpoint_name = endpoint.name
+def add_resource_entities(entities, coordinator, endpoint_name, resources, system):
+    endpoint = coordinator.endpoints[endpoint_name]
     master = None
 
     for resource_name in resources:
@@ -58,46 +108,23 @@ def add_resource_entities(entities, endpoint, resources, system):
 
         if master is None:
             _LOGGER.debug('Entity %s/%s is master sensor', endpoint_name, resource_name)
-            sensor = PolarMasterSensor(endpoint, resource, system)
+            sensor = PolarMasterSensor(coordinator, endpoint, resource, system)
             master = sensor
         else:
-            sensor = PolarSensor(endpoint, resource, system)
+            sensor = PolarSensor(coordinator.user_id, endpoint, resource, system)
             master.add_child(sensor)
         
         entities.append(sensor)
 
-class PolarEndpoint:
-    """Wrapper class for standardizing calls to Polar endpoints."""
-
-    def __init__(self, accesslink, endpoint_type, user_id, access_token):
-        self._accesslink = accesslink
-        self._endpoint = endpoint_type
-        self._user_id = user_id
-        self._access_token = access_token
-        self._transaction = None
-
-    @property
-    def name(self):
-        return self._endpoint.name
-
-    def create_transaction(self):
-        return getattr(self._accesslink, self._endpoint.name).create_transaction(self._user_id, self._access_token)
+    if master is not None:
+        master.compile_extractor()
 
-    def list_updates(self, transaction):
-        result = getattr(transaction, self._endpoint.list_method)()
-        return result[self._endpoint.result_name]
-
-    def get_update(self, transaction, url):
-        return getattr(transaction, self._endpoint.get_method)(url)
-
-    def get_timestamp(self, data):
-        return data[self._endpoint.timestamp_name]
-
-class PolarSensor(RestoreEntity):
+class PolarSensor(RestoreSensor):
     """Representation of a sensor."""
 
-    def __init__(self, endpoint, resource, system):
+    def __init__(self, user_id, endpoint, resource, system):
         """Initialize the sensor."""
+        self._user_id = user_id
         self._endpoint = endpoint
         self._resource = resource
         self._system = system
@@ -112,36 +139,49 @@ class PolarSensor(RestoreEntity):
         """Return the name of the sensor."""
         return self._resource.friendly_name
 
+    @property
+    def unique_id(self):
+        return f"{self._user_id}_{self._endpoint.name}_{self._resource.name}"
+
+    @property
+    def device_info(self):
+        return account_device_info(self._user_id)
+
     @property
     def icon(self):
         """Return the icon for the sensor."""
         return self._resource.icon
 
     @property
-    def state(self):
+    def native_value(self):
         """Return the state of the sensor."""
         return self._state
 
     @property
-    def unit_of_measurement(self):
+    def native_unit_of_measurement(self):
         """Return the unit of measurement of this entity, if any."""
         return self._resource.units.unit(self._system)
 
-    async def async_update_from_raw(self, raw):
-        item = raw
-        keys = self._resource.name.split('/')
+    @property
+    def device_class(self):
+        return self._resource.units.device_class
 
-        for key in keys:
-            item = item[key]
+    @property
+    def suggested_display_precision(self):
+        return self._resource.units.precision
 
-        item = self._resource.units.parse(item, self._system)
+    @property
+    def resource(self):
+        return self._resource
 
-        _LOGGER.debug('Setting state for resource %s/%s: %s', self._endpoint.name, self._resource.name, item)
-        self._state = item
+    def set_state(self, value):
+        """Store a new value, returning whether the state changed."""
+        if value == self._state:
+            return False
 
-        if not self.should_poll:
-            _LOGGER.debug('Triggering state update for resource: %s/%s', self._endpoint.name, self._resource.name)
-            await self.async_update_ha_state()
+        _LOGGER.debug('Setting state for resource %s/%s: %s', self._endpoint.name, self._resource.name, value)
+        self._state = value
+        return True
 
     async def async_added_to_hass(self):
         """Run when entity about to be added to hass."""
@@ -150,56 +190,206 @@ class PolarSensor(RestoreEntity):
             return
 
         _LOGGER.debug('Restoring state for resource: %s/%s', self._endpoint.name, self._resource.name)
+        unit = self.native_unit_of_measurement
+
+        # The displayed state may be converted to another unit, so only a
+        # native value in the current native unit is restored.
+        if HAS_RESTORE_SENSOR:
+            previous = await self.async_get_last_sensor_data()
+
+            if previous is not None and previous.native_unit_of_measurement == unit:
+                self._state = previous.native_value
+
+            return
+
         previous = await self.async_get_last_state()
 
-        if previous is not None:
-            self._state = previous.state
+        if previous is not None and previous.attributes.get('unit_of_measurement') == unit:
+            self._state = self._resource.units.restore(previous.state)
 
 class PolarMasterSensor(PolarSensor):
-    """Master sensor to coordinate update transactions to an Accesslink endpoint."""
+    """Master sensor to distribute coordinator updates to an endpoint's sensors."""
 
-    def __init__(self, endpoint, resource, system):
+    def __init__(self, coordinator, endpoint, resource, system):
         """Initialize the sensor."""
-        super().__init__(endpoint, resource, system)
+        super().__init__(coordinator.user_id, endpoint, resource, system)
+        self._coordinator = coordinator
         self._children = []
+        self._extractor = None
+
+    def add_child(self, child_entity):
+        self._children.append(child_entity)
+
+    def compile_extractor(self):
+        """Use the shared extractor for this sensor and its children."""
+        resources = [sensor.resource for sensor in [self] + self._children]
+        self._extractor = shared_extractor(tuple(resources), self._system)
+
+    async def async_added_to_hass(self):
+        """Subscribe to coordinator updates for this endpoint."""
+        await super().async_added_to_hass()
+
+        self.async_on_remove(
+            self._coordinator.async_add_listener(self._endpoint.name, self.async_update_from_item))
+
+        # Restored states are shown right away; the record store loads in the background.
+        self.hass.async_create_task(self._async_load_stored())
+
+    async def _async_load_stored(self):
+        await self._coordinator.store.async_wait_loaded()
+
+        stored = self._coordinator.store.latest(self._endpoint.name)
+
+        if stored is not None and self.hass is not None:
+            _LOGGER.debug('Loading stored state for endpoint: %s', self._endpoint.name)
+            self.async_write_changes(stored)
+
+    async def async_update_from_item(self, data):
+        """Update the sensor state from one item of a transaction."""
+        _LOGGER.debug('Processing update: %s', data)
+
+        self.async_write_changes(data)
+
+    @callback
+    def async_write_changes(self, raw):
+        """Compute all sensor values for a payload and write the changed ones."""
+        sensors = [self] + self._children
+        values = self._extractor.extract(raw)
+        changed = [
+            sensor for sensor in sensors
+            if sensor.set_state(values[sensor.resource.name])]
+
+        for sensor in changed:
+            if sensor.hass is not None:
+                sensor.async_write_ha_state()
+
+        _LOGGER.debug(
+            'Wrote %d states for endpoint %s, skipped %d unchanged',
+            len(changed), self._endpoint.name, len(sensors) - len(changed))
+
+class PolarStatisticSensor(SensorEntity):
+    """Rolling statistic derived from stored Polar records."""
+
+    def __init__(self, user_id, source, statistics, resource, system):
+        """Initialize the sensor."""
+        self._user_id = user_id
+        self._source = source
+        self._statistics = statistics
+        self._resource = resource
+        self._system = system
 
     @property
     def should_poll(self):
-        return True
+        return False
 
-    def add_child(self, child_entity):
-        self._children.append(child_entity)
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._resource.friendly_name
 
-    async def async_update(self):
-        """Update the sensor state."""
-        _LOGGER.debug('Beginning update for master sensor: %s/%s', self._endpoint.name, self._resource.name)
+    @property
+    def unique_id(self):
+        return f"{self._user_id}_{self._source}_{self._resource.name}"
 
-        transaction = self._endpoint.create_transaction()
+    @property
+    def device_info(self):
+        return account_device_info(self._user_id)
 
-        if transaction is None:
-            _LOGGER.debug('No updates available for endpoint %s', self._endpoint.name)
-            return
+    @property
+    def icon(self):
+        """Return the icon for the sensor."""
+        return self._resource.icon
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        value = self._statistics.value(self._resource.name)
+
+        if value is None:
+            return None
+
+        return self._resource.units.parse(value, self._system)
+
+    @property
+    def native_unit_of_measurement(self):
+        """Return the unit of measurement of this entity, if any."""
+        return self._resource.units.unit(self._system)
+
+    @property
+    def device_class(self):
+        return self._resource.units.device_class
+
+    @property
+    def suggested_display_precision(self):
+        return self._resource.units.precision
+
+    async def async_added_to_hass(self):
+        """Run when entity about to be added to hass."""
+        self.async_on_remove(
+            self._statistics.async_add_listener(self.async_write_ha_state))
+
+class PolarSampleSensor(PolarStatisticSensor):
+    """Value derived from the samples of the most recent exercise."""
 
-        updates = self._endpoint.list_updates(transaction)
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        from .samples import summary_value
 
-        if updates is not None:
-            timestamp = None
-            recent_update = None
+        return summary_value(self._statistics.latest, self._resource.name, self._system)
 
-            _LOGGER.debug('Found %d updates for endpoint %s', len(updates), self._endpoint.name)
+class PolarDiagnosticSensor(SensorEntity):
+    """Update pipeline metric for one endpoint."""
 
-            for url in updates:
-                _LOGGER.debug('Reading update for URL: %s', url)
-                data = self._endpoint.get_update(transaction, url)
+    def __init__(self, user_id, metrics, endpoint_name, resource):
+        """Initialize the sensor."""
+        self._user_id = user_id
+        self._metrics = metrics
+        self._endpoint_name = endpoint_name
+        self._resource = resource
 
-                if timestamp is None or self._endpoint.get_timestamp(data) > timestamp:
-                    recent_update = data
+    @property
+    def should_poll(self):
+        # Data age grows between updates; everything else changes on update.
+        return self._resource.name == DIAG_DATA_AGE
 
-            _LOGGER.debug('Using most recent update: %s', recent_update)
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return f"{self._endpoint_name.replace('_', ' ').title()} {self._resource.friendly_name}"
 
-            await self.async_update_from_raw(recent_update)
+    @property
+    def unique_id(self):
+        return f"{self._user_id}_{self._endpoint_name}_diagnostics_{self._resource.name}"
 
-            for child in self._children:
-                await child.async_update_from_raw(recent_update)
+    @property
+    def device_info(self):
+        return account_device_info(self._user_id)
 
-        transaction.commit()
+    @property
+    def icon(self):
+        """Return the icon for the sensor."""
+        return self._resource.icon
+
+    @property
+    def entity_category(self):
+        return ENTITY_CATEGORY_DIAGNOSTIC
+
+    @property
+    def native_value(self):
+        """Return the state of the sensor."""
+        return self._metrics.endpoints[self._endpoint_name].value(self._resource.name)
+
+    @property
+    def native_unit_of_measurement(self):
+        """Return the unit of measurement of this entity, if any."""
+        return self._resource.units.unit(None)
+
+    @property
+    def device_class(self):
+        return self._resource.units.device_class
+
+    async def async_added_to_hass(self):
+        """Run when entity about to be added to hass."""
+        self.async_on_remove(
+            self._metrics.async_add_listener(self.async_write_ha_state))
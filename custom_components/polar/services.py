@@ -0,0 +1,65 @@
+"""Polar services.
+
+The modules behind each service are only imported when it is first called,
+so installs that never use them do not pay for loading them.
+"""
+import voluptuous as vol
+
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    DOMAIN, DATA_COORDINATORS, SERVICE_IMPORT_HISTORY, SERVICE_PROFILE_UPDATE,
+    SERVICE_EXPORT, ATTR_ENTRY_ID, ATTR_FORMAT, ATTR_INCREMENTAL, EXPORT_FORMATS)
+
+ENTRY_SERVICE_SCHEMA = vol.Schema({vol.Optional(ATTR_ENTRY_ID): str})
+
+EXPORT_SCHEMA = ENTRY_SERVICE_SCHEMA.extend({
+    vol.Optional(ATTR_FORMAT): vol.In(EXPORT_FORMATS),
+    vol.Optional(ATTR_INCREMENTAL, default=False): cv.boolean})
+
+
+def _coordinators(hass, call):
+    """Yield (entry id, coordinator) for the entry a call targets, or all of them."""
+    entry_id = call.data.get(ATTR_ENTRY_ID)
+
+    for current_id, coordinator in list(hass.data.get(DATA_COORDINATORS, {}).items()):
+        if entry_id is None or entry_id == current_id:
+            yield current_id, coordinator
+
+
+@callback
+def async_register_services(hass):
+    """Register the polar.import_history, polar.profile_update and polar.export services."""
+    if hass.services.has_service(DOMAIN, SERVICE_IMPORT_HISTORY):
+        return
+
+    async def async_handle_import_history(call):
+        from .history import async_import_history
+
+        for _, coordinator in _coordinators(hass, call):
+            await async_import_history(hass, coordinator)
+
+    async def async_handle_profile_update(call):
+        from .metrics import async_profile_refresh
+
+        stamp = dt_util.utcnow().strftime('%Y%m%d%H%M%S')
+
+        for entry_id, coordinator in _coordinators(hass, call):
+            await async_profile_refresh(
+                hass, coordinator, hass.config.path(f"polar_profile_{entry_id}_{stamp}.prof"))
+
+    async def async_handle_export(call):
+        from .export import async_export
+
+        for _, coordinator in _coordinators(hass, call):
+            await async_export(
+                hass, coordinator, call.data.get(ATTR_FORMAT), call.data[ATTR_INCREMENTAL])
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_IMPORT_HISTORY, async_handle_import_history, schema=ENTRY_SERVICE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE_UPDATE, async_handle_profile_update, schema=ENTRY_SERVICE_SCHEMA)
+    hass.services.async_register(
+        DOMAIN, SERVICE_EXPORT, async_handle_export, schema=EXPORT_SCHEMA)
@@ -0,0 +1,242 @@
+"""Incrementally maintained rolling training statistics."""
+import datetime
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    CONF_DAILY_ACTIVITY, CONF_TRAINING_DATA, STATISTICS_STORAGE_KEY,
+    STATISTICS_STORAGE_VERSION, STAT_ACUTE_TRAINING_LOAD,
+    STAT_CHRONIC_TRAINING_LOAD, STAT_TRAINING_LOAD_RATIO, STAT_WEEKLY_DISTANCE,
+    STAT_WEEKLY_DURATION, STAT_WEEKLY_CALORIES, parse_duration, parse_timestamp)
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_DAYS = 28
+WINDOWS = (7, 28)
+
+METRIC_TRAINING_LOAD = 'training-load'
+METRIC_DISTANCE = 'distance'
+METRIC_DURATION = 'duration'
+METRIC_CALORIES = 'calories'
+
+SAVE_DELAY = 10
+
+STATISTIC_WINDOWS = {
+    STAT_ACUTE_TRAINING_LOAD: (METRIC_TRAINING_LOAD, 7),
+    STAT_WEEKLY_DISTANCE: (METRIC_DISTANCE, 7),
+    STAT_WEEKLY_DURATION: (METRIC_DURATION, 7),
+    STAT_WEEKLY_CALORIES: (METRIC_CALORIES, 7)}
+
+
+class RollingDailySum:
+    """Per-day totals in a fixed ring of days with running window sums.
+
+    Adding a value or moving to a new day touches a constant number of
+    slots, so window sums never need recomputing from history.
+    """
+
+    def __init__(self, size=HISTORY_DAYS, windows=WINDOWS):
+        self._size = size
+        self._windows = windows
+        self._slots = [0.0] * size
+        self._sums = dict.fromkeys(windows, 0.0)
+        self._today = None
+
+    def advance(self, ordinal):
+        """Move the ring forward so that the given day is the newest slot."""
+        if self._today is None:
+            self._today = ordinal
+            return
+
+        if ordinal - self._today >= self._size:
+            self._slots = [0.0] * self._size
+            self._sums = dict.fromkeys(self._windows, 0.0)
+            self._today = ordinal
+            return
+
+        while self._today < ordinal:
+            self._today += 1
+
+            for window in self._windows:
+                self._sums[window] -= self._slots[(self._today - window) % self._size]
+
+            self._slots[self._today % self._size] = 0.0
+
+    def add(self, ordinal, value):
+        self.advance(ordinal)
+        age = self._today - ordinal
+
+        if age >= self._size:
+            return
+
+        self._slots[ordinal % self._size] += value
+
+        for window in self._windows:
+            if age < window:
+                self._sums[window] += value
+
+    def replace(self, ordinal, value):
+        """Set the total for a day, for sources that resend whole-day values."""
+        self.advance(ordinal)
+
+        if self._today - ordinal < self._size:
+            self.add(ordinal, value - self._slots[ordinal % self._size])
+
+    def total(self, window):
+        return self._sums[window]
+
+    def as_dict(self):
+        return {'today': self._today, 'slots': self._slots}
+
+    @classmethod
+    def from_dict(cls, data):
+        rolling = cls()
+
+        if data and data.get('today') is not None:
+            today = data['today']
+            slots = data['slots']
+
+            for age in range(rolling._size - 1, -1, -1):
+                rolling.add(today - age, slots[(today - age) % rolling._size])
+
+        return rolling
+
+
+class PolarStatistics:
+    """Rolling training statistics for one user, persisted across restarts."""
+
+    def __init__(self, hass, user_id):
+        self.hass = hass
+        self._store = Store(
+            hass, STATISTICS_STORAGE_VERSION, STATISTICS_STORAGE_KEY.format(user_id))
+        self._metrics = {}
+        self._seen = {}
+        self._listeners = []
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+
+        self._metrics = {
+            name: RollingDailySum.from_dict(data.get('metrics', {}).get(name))
+            for name in (METRIC_TRAINING_LOAD, METRIC_DISTANCE, METRIC_DURATION, METRIC_CALORIES)}
+        self._seen = data.get('seen', {})
+        self._prune_seen()
+
+    @callback
+    def async_add_listener(self, listener):
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def total(self, metric, window):
+        self._metrics[metric].advance(dt_util.now().date().toordinal())
+        return self._metrics[metric].total(window)
+
+    def training_load_ratio(self):
+        """Acute:chronic workload ratio of the 7-day and 28-day load."""
+        acute = self.total(METRIC_TRAINING_LOAD, 7)
+        chronic = self.total(METRIC_TRAINING_LOAD, 28) / 4
+
+        return acute / chronic if chronic else None
+
+    def value(self, name):
+        """Return the current value of a statistic from STATISTICS."""
+        if name == STAT_TRAINING_LOAD_RATIO:
+            return self.training_load_ratio()
+
+        if name == STAT_CHRONIC_TRAINING_LOAD:
+            return self.total(METRIC_TRAINING_LOAD, 28) / 4
+
+        metric, window = STATISTIC_WINDOWS[name]
+        return self.total(metric, window)
+
+    async def async_add_exercise(self, data):
+        start = parse_timestamp(data.get('start-time') or '')
+
+        if start is None or not self._remember(data.get('id'), start.date()):
+            return
+
+        ordinal = start.date().toordinal()
+        self._metrics[METRIC_TRAINING_LOAD].add(ordinal, data.get('training-load') or 0)
+        self._metrics[METRIC_DISTANCE].add(ordinal, data.get('distance') or 0)
+
+        if data.get('duration'):
+            minutes = parse_duration(data['duration']).total_seconds() / 60
+            self._metrics[METRIC_DURATION].add(ordinal, minutes)
+
+        self._async_changed()
+
+    async def async_add_activity(self, data):
+        if not data.get('date'):
+            return
+
+        day = datetime.date.fromisoformat(data['date'])
+        self._metrics[METRIC_CALORIES].replace(day.toordinal(), data.get('calories') or 0)
+
+        self._async_changed()
+
+    def _remember(self, item_id, day):
+        """Track counted exercise ids so replayed items are not counted twice."""
+        if item_id is None:
+            return True
+
+        key = str(item_id)
+
+        if key in self._seen:
+            return False
+
+        self._seen[key] = day.toordinal()
+        return True
+
+    def _prune_seen(self):
+        """Forget exercise ids that have left the history window."""
+        oldest = dt_util.now().date().toordinal() - HISTORY_DAYS
+        self._seen = {
+            key: ordinal for key, ordinal in self._seen.items() if ordinal > oldest}
+
+    @callback
+    def _async_changed(self):
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+        for listener in list(self._listeners):
+            listener()
+
+    @callback
+    def _data_to_save(self):
+        return {
+            'metrics': {name: rolling.as_dict() for name, rolling in self._metrics.items()},
+            'seen': self._seen}
+
+    @callback
+    def async_attach(self, coordinator):
+        """Feed new items from the coordinator and roll windows over at midnight."""
+        listeners = {
+            CONF_TRAINING_DATA: self.async_add_exercise,
+            CONF_DAILY_ACTIVITY: self.async_add_activity}
+
+        unsubscribe = [
+            coordinator.async_add_listener(name, listener)
+            for name, listener in listeners.items()
+            if name in coordinator.endpoints]
+
+        unsubscribe.append(
+            async_track_time_change(self.hass, self._async_midnight, hour=0, minute=0, second=0))
+
+        return unsubscribe
+
+    @callback
+    def _async_midnight(self, now):
+        # Pruned once a day rather than on every exercise, keeping updates O(1).
+        self._prune_seen()
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+        for listener in list(self._listeners):
+            listener()
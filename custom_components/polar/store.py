@@ -0,0 +1,254 @@
+"""Append-only local storage for fetched Polar records."""
+import asyncio
+import datetime
+import json
+import logging
+import os
+
+from .const import TRANSACTION_SEGMENT, parse_timestamp
+
+_LOGGER = logging.getLogger(__name__)
+
+RECORDS_FILE = 'records.jsonl'
+JOURNAL_FILE = 'journal.jsonl'
+
+JOURNAL_OPENED = 'opened'
+JOURNAL_STORED = 'stored'
+JOURNAL_COMMITTED = 'committed'
+
+MIN_TIMESTAMP = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+
+def item_key(url):
+    """Key an item by its URL without the transaction that listed it."""
+    return TRANSACTION_SEGMENT.sub('', url)
+
+
+def _timestamp_key(raw):
+    """Sort key for a record timestamp; naive local times compare as UTC."""
+    parsed = parse_timestamp(raw) if raw else None
+
+    if parsed is None:
+        return MIN_TIMESTAMP
+
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+class PolarRecordStore:
+    """Crash-safe store of every record fetched from AccessLink for one user.
+
+    Records are appended as JSON lines and fsynced before the transaction
+    that delivered them is committed. An in-memory index maps each item URL,
+    without its transaction segment, to its file offset, so records can be
+    deduplicated and read back without keeping the payloads in memory.
+    """
+
+    def __init__(self, hass, path):
+        self.hass = hass
+        self.path = path
+        self._offsets = {}
+        self._latest = {}
+        self._pending = {}
+        self._lock = asyncio.Lock()
+        self._loaded = asyncio.Event()
+
+    @property
+    def records_path(self):
+        return os.path.join(self.path, RECORDS_FILE)
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.path, JOURNAL_FILE)
+
+    def __contains__(self, url):
+        return item_key(url) in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def latest(self, endpoint_name):
+        """Return the newest stored payload for an endpoint, if any."""
+        record = self._latest.get(endpoint_name)
+        return record['data'] if record is not None else None
+
+    def pending_transactions(self):
+        """Return transactions that were opened but never committed."""
+        return dict(self._pending)
+
+    async def async_load(self):
+        try:
+            await self.hass.async_add_executor_job(self._load)
+        finally:
+            self._loaded.set()
+
+        _LOGGER.debug('Loaded %d stored Polar records from %s', len(self._offsets), self.path)
+
+        for url, endpoint_name in self._pending.items():
+            _LOGGER.info('Found uncommitted %s transaction from previous run: %s', endpoint_name, url)
+
+    async def async_wait_loaded(self):
+        """Wait until a load started in the background has finished."""
+        await self._loaded.wait()
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'r+b') as records:
+                offset = 0
+
+                for line in records:
+                    if not line.endswith(b'\n'):
+                        # Drop a torn final line left by a crash mid-write.
+                        _LOGGER.warning('Truncating incomplete record at offset %d', offset)
+                        records.truncate(offset)
+                        break
+
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        _LOGGER.warning('Skipping corrupt record at offset %d', offset)
+                    else:
+                        self._index(record, offset)
+
+                    offset += len(line)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+
+                    if entry['state'] == JOURNAL_COMMITTED:
+                        self._pending.pop(entry['transaction'], None)
+                    else:
+                        self._pending[entry['transaction']] = entry['endpoint']
+
+    def _index(self, record, offset):
+        # Records written before keys were normalised still carry the
+        # transaction segment.
+        self._offsets[item_key(record['key'])] = offset
+
+        endpoint_name = record['endpoint']
+        latest = self._latest.get(endpoint_name)
+
+        # Compared as datetimes: a Z suffix or a fraction breaks string order.
+        if latest is None or _timestamp_key(record['timestamp']) >= _timestamp_key(latest['timestamp']):
+            self._latest[endpoint_name] = record
+
+    async def async_append(self, endpoint_name, records):
+        """Durably append (url, timestamp, data) records not yet stored."""
+        async with self._lock:
+            records = list({
+                item_key(url): {
+                    'endpoint': endpoint_name, 'key': item_key(url),
+                    'timestamp': timestamp, 'data': data}
+                for url, timestamp, data in records
+                if item_key(url) not in self._offsets}.values())
+
+            if records:
+                await self.hass.async_add_executor_job(self._append, records)
+
+        return len(records)
+
+    def _append(self, records):
+        with open(self.records_path, 'ab') as output:
+            offset = output.tell()
+
+            for record in records:
+                line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+                output.write(line)
+                self._index(record, offset)
+                offset += len(line)
+
+            output.flush()
+            os.fsync(output.fileno())
+
+    async def async_get(self, urls):
+        """Read stored payloads back from disk."""
+        async with self._lock:
+            return await self.hass.async_add_executor_job(
+                self._get, [item_key(url) for url in urls])
+
+    def _get(self, keys):
+        result = []
+
+        with open(self.records_path, 'rb') as records:
+            for key in keys:
+                records.seek(self._offsets[key])
+                result.append(json.loads(records.readline())['data'])
+
+        return result
+
+    async def async_iter(self, endpoint_name=None, batch_size=500, start=0, end=None):
+        """Stream stored records from disk in bounded batches.
+
+        start and end are byte offsets into the records file, as returned by
+        async_size, so a caller can resume after the records it has seen.
+        """
+        if not os.path.exists(self.records_path):
+            return
+
+        records = await self.hass.async_add_executor_job(open, self.records_path, 'rb')
+
+        try:
+            if start:
+                records.seek(start)
+
+            while True:
+                batch = await self.hass.async_add_executor_job(
+                    _read_batch, records, endpoint_name, batch_size, end)
+
+                if batch is None:
+                    return
+
+                for record in batch:
+                    yield record
+        finally:
+            await self.hass.async_add_executor_job(records.close)
+
+    async def async_size(self):
+        """Return the byte offset just past the last stored record."""
+        async with self._lock:
+            return await self.hass.async_add_executor_job(self._size)
+
+    def _size(self):
+        return os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+
+    async def async_journal(self, endpoint_name, transaction_url, state):
+        """Record the progress of a transaction."""
+        if state == JOURNAL_COMMITTED:
+            self._pending.pop(transaction_url, None)
+        else:
+            self._pending[transaction_url] = endpoint_name
+
+        entry = {'endpoint': endpoint_name, 'transaction': transaction_url, 'state': state}
+        await self.hass.async_add_executor_job(self._write_journal, entry)
+
+    def _write_journal(self, entry):
+        with open(self.journal_path, 'ab') as journal:
+            journal.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+def _read_batch(records, endpoint_name, batch_size, end=None):
+    batch = []
+
+    for _ in range(batch_size):
+        line = records.readline() if end is None or records.tell() < end else b''
+
+        if not line:
+            return batch or None
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+
+        if endpoint_name is None or record['endpoint'] == endpoint_name:
+            batch.append(record)
+
+    return batch
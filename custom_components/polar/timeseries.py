@@ -0,0 +1,245 @@
+"""Tiered time-series storage of intraday daily-activity samples."""
+import array
+import datetime
+import logging
+import os
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later, async_track_time_change
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    SERIES_STEPS, SERIES_SEDENTARY, ACTIVITY_SAMPLE_SERIES, parse_duration)
+
+_LOGGER = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# Raw samples are kept for a week, so a resent day can replace its samples.
+RAW_RETENTION = 7 * DAY
+# Rollup bucket size in seconds and how long buckets are kept; None is forever.
+ROLLUPS = ((5 * 60, 90 * DAY), (60 * 60, None))
+
+TIER_RAW = 'raw'
+TIER_DAILY = 'daily'
+SERIES_SUFFIX = '.f64'
+
+# Polar activity zone indexes: 0 sleep, 1 sedentary, 2 light, 3 moderate,
+# 4 vigorous, 5 non-wear.
+ZONE_SEDENTARY = 1
+
+SAVE_DELAY = 30
+
+
+class TieredSeries:
+    """Samples with raw, rolled-up and per-day tiers kept in step on ingest.
+
+    Setting a sample applies only the change in its value to each rollup
+    bucket and the day total, so resent samples replace earlier ones and no
+    tier is ever recomputed from the raw data.
+    """
+
+    def __init__(self):
+        self.tiers = {TIER_RAW: {}, TIER_DAILY: {}}
+
+        for size, _ in ROLLUPS:
+            self.tiers[size] = {}
+
+    def set(self, timestamp, day, value, now):
+        """Set the sample at an epoch timestamp on a local day ordinal."""
+        if timestamp < now - RAW_RETENTION:
+            # Rollups can no longer tell a resent sample from a new one.
+            return False
+
+        raw = self.tiers[TIER_RAW]
+        delta = value - raw.get(timestamp, 0.0)
+        raw[timestamp] = value
+
+        if not delta:
+            return False
+
+        for size, _ in ROLLUPS:
+            buckets = self.tiers[size]
+            start = timestamp - timestamp % size
+            buckets[start] = buckets.get(start, 0.0) + delta
+
+        daily = self.tiers[TIER_DAILY]
+        daily[day] = daily.get(day, 0.0) + delta
+
+        return True
+
+    def day_total(self, day):
+        return self.tiers[TIER_DAILY].get(day, 0.0)
+
+    def prune(self, now):
+        """Drop raw samples and rollup buckets past their retention."""
+        retention = [(TIER_RAW, RAW_RETENTION)] + [
+            (size, keep) for size, keep in ROLLUPS if keep is not None]
+
+        for tier, keep in retention:
+            cutoff = now - keep
+            values = self.tiers[tier]
+
+            for key in [key for key in values if key < cutoff]:
+                del values[key]
+
+    def dump(self, tier):
+        pairs = array.array('d')
+
+        for key in sorted(self.tiers[tier]):
+            pairs.append(key)
+            pairs.append(self.tiers[tier][key])
+
+        return pairs
+
+    def load(self, tier, pairs):
+        self.tiers[tier] = {
+            int(pairs[index]) if tier == TIER_DAILY else pairs[index]: pairs[index + 1]
+            for index in range(0, len(pairs) - 1, 2)}
+
+
+def _seconds_of_day(raw):
+    hours, minutes, seconds = raw.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+class ActivitySampleStore:
+    """On-disk tiered store of step and activity-zone samples for one user."""
+
+    def __init__(self, hass, path):
+        self.hass = hass
+        self.path = path
+        self.series = {name: TieredSeries() for name in ACTIVITY_SAMPLE_SERIES}
+        self._listeners = []
+        self._save_timer = None
+
+    def _tier_path(self, name, tier):
+        return os.path.join(self.path, f"{name}.{tier}{SERIES_SUFFIX}")
+
+    async def async_load(self):
+        await self.hass.async_add_executor_job(self._load)
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        for name, series in self.series.items():
+            for tier in series.tiers:
+                path = self._tier_path(name, tier)
+
+                if os.path.exists(path):
+                    pairs = array.array('d')
+
+                    with open(path, 'rb') as source:
+                        pairs.frombytes(source.read())
+
+                    series.load(tier, pairs)
+
+    def _save(self, dumps):
+        for (name, tier), pairs in dumps.items():
+            path = self._tier_path(name, tier)
+            temporary = f"{path}.tmp"
+
+            with open(temporary, 'wb') as output:
+                pairs.tofile(output)
+
+            os.replace(temporary, path)
+
+    @callback
+    def async_schedule_save(self):
+        if self._save_timer is not None:
+            return
+
+        @callback
+        def save(now):
+            self._save_timer = None
+            self.hass.async_create_task(self.async_save())
+
+        self._save_timer = async_call_later(self.hass, SAVE_DELAY, save)
+
+    async def async_save(self):
+        now = dt_util.utcnow().timestamp()
+        dumps = {}
+
+        # Snapshot on the loop so ingestion never races the writer.
+        for name, series in self.series.items():
+            series.prune(now)
+
+            for tier in series.tiers:
+                dumps[(name, tier)] = series.dump(tier)
+
+        await self.hass.async_add_executor_job(self._save, dumps)
+
+    @callback
+    def async_add_listener(self, listener):
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    def value(self, name):
+        """Return today's total of a series from ACTIVITY_SAMPLE_SERIES."""
+        return round(self.series[name].day_total(dt_util.now().date().toordinal()))
+
+    async def async_ingest(self, transaction, url, activity):
+        """Fetch and store the step and zone samples of one activity day."""
+        if not activity.get('date'):
+            return
+
+        day = datetime.date.fromisoformat(activity['date'])
+        start = dt_util.start_of_local_day(day).timestamp()
+        ordinal = day.toordinal()
+        now = dt_util.utcnow().timestamp()
+        changed = False
+
+        steps = await transaction.get_item(f"{url}/step-samples") or {}
+
+        for sample in steps.get('samples') or []:
+            if sample.get('time') and sample.get('steps') is not None:
+                changed |= self.series[SERIES_STEPS].set(
+                    start + _seconds_of_day(sample['time']), ordinal, sample['steps'], now)
+
+        zones = await transaction.get_item(f"{url}/zone-samples") or {}
+
+        for sample in zones.get('samples') or []:
+            if not sample.get('time'):
+                continue
+
+            # Time in a zone is counted in the bucket the sample starts in.
+            minutes = sum(
+                parse_duration(zone['inzone']).total_seconds() / 60
+                for zone in sample.get('activity-zones') or []
+                if zone.get('index') == ZONE_SEDENTARY and zone.get('inzone'))
+
+            changed |= self.series[SERIES_SEDENTARY].set(
+                start + _seconds_of_day(sample['time']), ordinal, minutes, now)
+
+        if changed:
+            self.async_schedule_save()
+
+            for listener in list(self._listeners):
+                listener()
+
+    @callback
+    def async_attach(self, coordinator):
+        """Roll the daily values over at midnight and save on stop."""
+        unsubscribe = async_track_time_change(
+            self.hass, self._async_midnight, hour=0, minute=0, second=0)
+
+        @callback
+        def stop():
+            unsubscribe()
+
+            if self._save_timer is not None:
+                self._save_timer()
+                self._save_timer = None
+                self.hass.async_create_task(self.async_save())
+
+        return [stop]
+
+    @callback
+    def _async_midnight(self, now):
+        for listener in list(self._listeners):
+            listener()
@@ -0,0 +1,128 @@
+"""Webhook push support for Polar AccessLink."""
+import hashlib
+import hmac
+import json
+import logging
+
+import aiohttp
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.network import NoURLAvailableError, get_url
+
+from .client import PolarApiError, TRANSPORT_ERRORS
+from .const import (
+    DOMAIN, CONF_CLIENT_ID, CONF_WEBHOOK_ID, CONF_WEBHOOK_SECRET,
+    WEBHOOK_NAME, WEBHOOK_PATH, WEBHOOK_SIGNATURE_HEADER, WEBHOOK_PING,
+    WEBHOOK_EVENTS, SIGNAL_WEBHOOK_UPDATE)
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_WEBHOOK_VIEW = 'polar_webhook_view'
+
+
+def verify_signature(secret, body, signature):
+    """Check the HMAC-SHA256 signature AccessLink attaches to webhook calls."""
+    if not secret or not signature:
+        return False
+
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+async def async_setup_webhook(hass, entry, accesslink):
+    """Register the webhook view and make sure AccessLink pushes to it."""
+    if not hass.data.get(DATA_WEBHOOK_VIEW):
+        hass.http.register_view(PolarWebhookView())
+        hass.data[DATA_WEBHOOK_VIEW] = True
+
+    if entry.data.get(CONF_WEBHOOK_SECRET):
+        return
+
+    # Webhooks belong to the client, so reuse one another entry already created.
+    for other in hass.config_entries.async_entries(DOMAIN):
+        if (other.entry_id != entry.entry_id
+                and other.data.get(CONF_CLIENT_ID) == accesslink.client_id
+                and other.data.get(CONF_WEBHOOK_SECRET)):
+            _async_store_webhook(
+                hass, entry, other.data.get(CONF_WEBHOOK_ID),
+                other.data[CONF_WEBHOOK_SECRET])
+            return
+
+    try:
+        url = f"{get_url(hass, allow_internal=False)}{WEBHOOK_PATH}"
+    except NoURLAvailableError:
+        _LOGGER.warning('No external URL configured for the Polar webhook, falling back to polling')
+        return
+
+    try:
+        webhook = await accesslink.create_webhook(url, WEBHOOK_EVENTS.keys())
+    except (PolarApiError, *TRANSPORT_ERRORS) as err:
+        _LOGGER.warning('Unable to register Polar webhook, falling back to polling: %r', err)
+        return
+
+    _LOGGER.debug('Registered Polar webhook %s at %s', webhook['id'], url)
+    _async_store_webhook(hass, entry, webhook['id'], webhook['signature_secret_key'])
+
+    try:
+        # The signature key is only returned on creation, so webhooks whose
+        # key we no longer know are removed once the new one exists.
+        for existing in await accesslink.list_webhooks():
+            if existing.get('id') != webhook['id']:
+                _LOGGER.debug('Removing previous Polar webhook: %s', existing.get('id'))
+                await accesslink.delete_webhook(existing['id'])
+    except (PolarApiError, *TRANSPORT_ERRORS) as err:
+        _LOGGER.warning('Unable to remove previous Polar webhooks: %r', err)
+
+
+def _async_store_webhook(hass, entry, webhook_id, secret):
+    hass.config_entries.async_update_entry(
+        entry,
+        data={**entry.data, CONF_WEBHOOK_ID: webhook_id, CONF_WEBHOOK_SECRET: secret})
+
+
+class PolarWebhookView(HomeAssistantView):
+    """Polar Accesslink Webhook View."""
+
+    requires_auth = False
+    url = WEBHOOK_PATH
+    name = WEBHOOK_NAME
+
+    async def post(self, request):
+        """Receive a webhook notification."""
+        hass = request.app['hass']
+        body = await request.read()
+        signature = request.headers.get(WEBHOOK_SIGNATURE_HEADER)
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return aiohttp.web_response.Response(status=400, text='Invalid payload')
+
+        event = payload.get('event') if isinstance(payload, dict) else None
+
+        # AccessLink pings while the webhook is being created, before the
+        # signature key has been returned to us, so pings cannot be verified.
+        if event == WEBHOOK_PING:
+            _LOGGER.debug('Received Polar webhook ping')
+            return aiohttp.web_response.Response(status=200)
+
+        secrets = {
+            entry.data.get(CONF_WEBHOOK_SECRET)
+            for entry in hass.config_entries.async_entries(DOMAIN)}
+
+        if not any(verify_signature(secret, body, signature) for secret in secrets):
+            _LOGGER.warning('Rejected Polar webhook call with invalid signature')
+            return aiohttp.web_response.Response(status=401, text='Invalid signature')
+
+        endpoint_name = WEBHOOK_EVENTS.get(event)
+
+        if endpoint_name is None:
+            _LOGGER.debug('Ignoring Polar webhook event: %s', event)
+            return aiohttp.web_response.Response(status=200)
+
+        _LOGGER.debug('Received Polar webhook %s for user %s', event, payload.get('user_id'))
+        async_dispatcher_send(
+            hass, SIGNAL_WEBHOOK_UPDATE.format(payload.get('user_id'), endpoint_name))
+
+        return aiohttp.web_response.Response(status=200)